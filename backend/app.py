@@ -3,7 +3,10 @@ from flask_cors import CORS
 import threading
 from backend.delete_temp_files import delete_temp_files
 from backend.routes.upload import upload_blueprint
-from prometheus_client import start_http_server
+from backend.routes.jobs import jobs_blueprint
+from backend.job_metrics import job_metrics
+from backend.config import APP_PORT, METRICS_PORT
+from prometheus_client import start_http_server, REGISTRY
 
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
@@ -13,6 +16,10 @@ CORS(app)
 
 
 app.register_blueprint(upload_blueprint)
+app.register_blueprint(jobs_blueprint)
+
+# Jauges d'anomalies exposées par traitement (label job_id), lues dans METRICS_DIR
+job_metrics.register(REGISTRY)
 
 
 @app.route("/metrics")
@@ -23,5 +30,5 @@ def metrics():
 threading.Thread(target=delete_temp_files, daemon=True).start()
 
 if __name__ == "__main__":
-    start_http_server(8000)
-    app.run(debug=True, use_reloader=False, port=5000)
\ No newline at end of file
+    start_http_server(METRICS_PORT)
+    app.run(debug=True, use_reloader=False, port=APP_PORT)
\ No newline at end of file
@@ -0,0 +1,415 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+import yaml
+from backend.benchmarks.synthetic import generate, write_delivery
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Test de charge d'un serveur de vérification : des livraisons synthétiques (voir synthetic.py) sont
+# envoyées à /upload, avec une part d'appels à /save-email, à un débit d'arrivée et une concurrence
+# donnés. Chaque livraison est suivie par /jobs/<job_id> jusqu'à la fin de son traitement.
+# Le rapport donne le débit, les latences p50/p95/p99, les erreurs et la mémoire résidente du
+# serveur (avec ses processus de calcul) au cours du test.
+#
+#   python -m backend.benchmarks.load_test --sizes 200,1000 --concurrency 4 --rate 0.5 --requests 40
+#   python -m backend.benchmarks.load_test --url http://localhost:5000 --pid 1234 --duration 300
+#
+# Sans --url, un serveur (python -m backend.app) est lancé sur un port libre, sans cache des
+# résultats, et /save-email y modifie une copie locale de alertmanager.yml rechargée par un faux
+# Alertmanager : le test ne sort pas de la machine
+
+POLL_INTERVAL = 0.2
+SERVER_START_TIMEOUT = 60
+# Configuration minimale modifiée par /save-email
+ALERTMANAGER_CONFIG = {
+    'route': {'receiver': 'team-email'},
+    'receivers': [{'name': 'team-email', 'email_configs': [{'to': 'equipe@example.com'}]}],
+}
+
+
+class StubAlertmanager:
+    # Faux Alertmanager local : répond 200 à POST /-/reload et compte les rechargements
+
+    def __init__(self):
+        stub = self
+        self.reloads = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path == '/-/reload':
+                    stub.reloads += 1
+                    self.send_response(200)
+                else:
+                    self.send_response(404)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/-/reload"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_rss(pid):
+    # Mémoire résidente du processus et de ses descendants (processus de calcul), en octets ; None
+    # si elle n'est pas lisible (ni psutil ni /proc)
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+        except psutil.Error:
+            return None
+    if not os.path.isdir('/proc'):
+        return None
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # Champ 4 (ppid), après le nom du processus entre parenthèses
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        todo.extend(child for child, parent in parents.items() if parent == current)
+    total = 0
+    for current in pids:
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            if current == pid:
+                return None
+    return total
+
+
+class LocalServer:
+    # Serveur de vérification lancé pour le test, avec son faux Alertmanager ; env complète
+    # l'environnement du serveur (JOB_WORKERS, EXECUTION_MODE...)
+
+    def __init__(self, directory, env=None, cache=False):
+        os.makedirs(directory, exist_ok=True)
+        self.alertmanager = StubAlertmanager()
+        config_path = os.path.join(directory, 'alertmanager.yml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(ALERTMANAGER_CONFIG, f)
+        port = _free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        server_env = {
+            **os.environ,
+            'APP_PORT': str(port),
+            'METRICS_PORT': str(_free_port()),
+            'ALERTMANAGER_CONFIG_PATH': config_path,
+            'ALERTMANAGER_RELOAD_URL': self.alertmanager.url,
+            'METRICS_DIR': os.path.join(directory, 'metrics'),
+            'EXPORT_DIR': os.path.join(directory, 'exports'),
+            'FEATURE_STATE_DIR': os.path.join(directory, 'features'),
+            'RESULT_CACHE_DIR': os.path.join(directory, 'cache'),
+            **({} if cache else {'RESULT_CACHE_SIZE': '0'}),
+            **(env or {}),
+        }
+        self.log_path = os.path.join(directory, 'server.log')
+        self._log = open(self.log_path, 'w')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'backend.app'], cwd=root, env=server_env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        self.pid = self.process.pid
+
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Le serveur s'est arrêté au démarrage, voir {self.log_path}")
+            try:
+                requests.get(f"{self.url}/metrics", timeout=1)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError(f"Le serveur ne répond pas après {SERVER_START_TIMEOUT} s, voir {self.log_path}")
+                time.sleep(0.2)
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+        self.alertmanager.close()
+
+
+class LoadTest:
+    # Envoie les requêtes et relève leurs résultats ; une requête est chronométrée depuis son heure
+    # d'arrivée prévue, attente côté client comprise, pour ne pas masquer la saturation du serveur
+
+    def __init__(self, url, deliveries, email_share=0.0, choice='di', seed=0):
+        self.url = url.rstrip('/')
+        self.deliveries = deliveries
+        self.email_share = email_share
+        self.choice = choice
+        self.random = random.Random(seed)
+        self.results = []
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _record(self, **result):
+        with self._lock:
+            self.results.append(result)
+
+    def request(self, scheduled):
+        with self._lock:
+            self.in_flight += 1
+            email = self.random.random() < self.email_share
+            delivery = self.random.choice(self.deliveries)
+        try:
+            if email:
+                self._save_email(scheduled)
+            else:
+                self._upload(scheduled, delivery)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _save_email(self, scheduled):
+        try:
+            response = self._session().post(f"{self.url}/save-email", json={'email': 'charge@example.com'}, timeout=60)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        self._record(kind='save-email', start=scheduled, seconds=time.perf_counter() - scheduled, error=error)
+
+    def _upload(self, scheduled, delivery):
+        session = self._session()
+        try:
+            with open(delivery, 'rb') as f:
+                response = session.post(f"{self.url}/upload", files={'file': ('livraison.zip', f)}, data={
+                    'choice': self.choice, 'email': 'charge@example.com', 'message': 'test de charge',
+                }, timeout=300)
+        except requests.RequestException as e:
+            self._record(kind='upload', start=scheduled, seconds=time.perf_counter() - scheduled, error=type(e).__name__)
+            return
+        accepted = time.perf_counter()
+        self._record(
+            kind='upload', start=scheduled, seconds=accepted - scheduled,
+            error=None if response.status_code == 202 else f"HTTP {response.status_code}"
+        )
+        if response.status_code != 202:
+            return
+
+        # Suivi du traitement jusqu'à son résultat
+        job_url = f"{self.url}/jobs/{response.json()['job_id']}"
+        error = None
+        try:
+            while True:
+                job = session.get(job_url, timeout=60).json()
+                if job['status'] not in ('queued', 'running'):
+                    break
+                time.sleep(POLL_INTERVAL)
+            if job['status'] != 'done':
+                error = f"job {job['status']}"
+        except (requests.RequestException, ValueError) as e:
+            error = type(e).__name__
+        self._record(kind='job', start=scheduled, seconds=time.perf_counter() - scheduled, error=error)
+
+    def run(self, concurrency, rate=None, arrivals='poisson', requests_count=None, duration=None, server_pid=None, rss_interval=1.0):
+        # Sans rate, chacun des concurrency clients enchaîne ses requêtes (boucle fermée) ; avec rate
+        # (requêtes par seconde), les arrivées sont indépendantes des réponses et au plus concurrency
+        # requêtes sont en cours, les suivantes attendent côté client
+        start = time.perf_counter()
+        stop = threading.Event()
+        timeline = []
+
+        def sample_memory():
+            while not stop.is_set():
+                rss = process_rss(server_pid) if server_pid else None
+                timeline.append({'t': time.perf_counter() - start, 'rss': rss, 'in_flight': self.in_flight})
+                stop.wait(rss_interval)
+
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+
+        def more(sent):
+            return (requests_count is None or sent < requests_count) and (duration is None or time.perf_counter() - start < duration)
+
+        sent = 0
+        counter = threading.Lock()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='client') as executor:
+            if rate:
+                scheduled = start
+                while more(sent):
+                    delay = self.random.expovariate(rate) if arrivals == 'poisson' else 1 / rate
+                    scheduled += delay
+                    time.sleep(max(0.0, scheduled - time.perf_counter()))
+                    if duration is not None and scheduled - start >= duration:
+                        break
+                    executor.submit(self.request, scheduled)
+                    sent += 1
+            else:
+                def client():
+                    nonlocal sent
+                    while True:
+                        with counter:
+                            if not more(sent):
+                                return
+                            sent += 1
+                        self.request(time.perf_counter())
+
+                for _ in range(concurrency):
+                    executor.submit(client)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+        for result in self.results:
+            result['start'] -= start
+        return {'elapsed': elapsed, 'sent': sent, 'results': self.results, 'timeline': timeline}
+
+
+def summary(run):
+    # Débit, latences et erreurs par type de requête
+    stats = {}
+    for kind in ('upload', 'job', 'save-email'):
+        results = [r for r in run['results'] if r['kind'] == kind]
+        if not results:
+            continue
+        ok = np.array([r['seconds'] for r in results if r['error'] is None])
+        errors = {}
+        for r in results:
+            if r['error'] is not None:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+        stats[kind] = {
+            'count': len(results),
+            'throughput': len(ok) / run['elapsed'],
+            'error_rate': sum(errors.values()) / len(results),
+            'errors': errors,
+            **({
+                'p50': float(np.percentile(ok, 50)),
+                'p95': float(np.percentile(ok, 95)),
+                'p99': float(np.percentile(ok, 99)),
+                'max': float(ok.max()),
+            } if len(ok) else {}),
+        }
+    return stats
+
+
+def report(run, stats, rss_rows=20):
+    labels = {'upload': 'upload (réponse)', 'job': 'traitement', 'save-email': 'save-email'}
+    lines = [
+        f"{run['sent']} requêtes en {run['elapsed']:.1f} s ({run['sent'] / run['elapsed']:.2f} requêtes/s)",
+        f"{'':18}{'nombre':>8}{'débit/s':>9}{'erreurs':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'max s':>9}",
+    ]
+    for kind, entry in stats.items():
+        line = f"{labels[kind]:18}{entry['count']:8d}{entry['throughput']:9.2f}{entry['error_rate']:8.0%} "
+        line += ''.join(f"{entry[key]:9.2f}" for key in ('p50', 'p95', 'p99', 'max')) if 'p50' in entry else ''
+        lines.append(line)
+    errors = {f"{kind} {error}": count for kind, entry in stats.items() for error, count in entry['errors'].items()}
+    if errors:
+        lines.append(f"Erreurs : {errors}")
+
+    # Mémoire du serveur au cours du test, sur au plus rss_rows lignes
+    timeline = [point for point in run['timeline'] if point['rss'] is not None]
+    if timeline:
+        peak = max(point['rss'] for point in timeline)
+        lines.append(
+            f"Mémoire du serveur (RSS) : début {timeline[0]['rss'] / 1e6:.0f} Mo, pic {peak / 1e6:.0f} Mo, fin {timeline[-1]['rss'] / 1e6:.0f} Mo"
+        )
+        lines.append(f"{'t s':>8}{'RSS Mo':>10}{'en cours':>10}")
+        step = max(1, len(timeline) // rss_rows)
+        for point in timeline[::step]:
+            lines.append(f"{point['t']:8.1f}{point['rss'] / 1e6:10.0f}{point['in_flight']:10d}")
+    else:
+        lines.append("Mémoire du serveur non mesurée (--pid, ou psutil hors Linux)")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de /upload et /save-email avec des livraisons synthétiques")
+    parser.add_argument('--url', help="serveur à tester ; par défaut un serveur local est lancé pour le test")
+    parser.add_argument('--pid', type=int, help="processus du serveur donné par --url, pour sa mémoire")
+    parser.add_argument('--server-env', action='append', default=[], metavar='NOM=VALEUR', help="variable d'environnement du serveur lancé (JOB_WORKERS=2...)")
+    parser.add_argument('--cache', action='store_true', help="garder le cache des résultats du serveur lancé")
+    parser.add_argument('--sizes', default='200,1000', help="nombres de PB des livraisons envoyées, séparés par des virgules")
+    parser.add_argument('--deliveries', type=int, default=2, help="livraisons différentes par taille")
+    parser.add_argument('--anomalies', type=int, default=1, help="anomalies injectées de chaque type dans les livraisons")
+    parser.add_argument('--choice', default='di', choices=['di', 'tr'])
+    parser.add_argument('--concurrency', type=int, default=4, help="requêtes en cours au plus")
+    parser.add_argument('--rate', type=float, help="arrivées par seconde ; sans rate, boucle fermée de concurrency clients")
+    parser.add_argument('--arrivals', default='poisson', choices=['poisson', 'constant'])
+    parser.add_argument('--requests', type=int, help="nombre de requêtes (20 sans --duration)")
+    parser.add_argument('--duration', type=float, help="durée d'envoi des requêtes, en secondes")
+    parser.add_argument('--email-share', type=float, default=0.1, help="part des requêtes envoyées à /save-email")
+    parser.add_argument('--rss-interval', type=float, default=1.0, help="intervalle de mesure de la mémoire du serveur, en secondes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="fichier JSON des résultats détaillés")
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.requests = 20
+
+    with tempfile.TemporaryDirectory(prefix='load-test-') as directory:
+        deliveries = []
+        for n_pb in [int(size) for size in args.sizes.split(',')]:
+            for i in range(args.deliveries):
+                layers, _ = generate(n_pb, args.choice, args.anomalies, seed=args.seed + i)
+                deliveries.append(write_delivery(layers, os.path.join(directory, f"{n_pb}_{i}"))[1])
+        print(f"{len(deliveries)} livraisons synthétiques générées")
+
+        server = None
+        if args.url is None:
+            # Répertoire conservé après le test, pour le journal du serveur
+            server = LocalServer(
+                tempfile.mkdtemp(prefix='load-test-server-'), dict(item.split('=', 1) for item in args.server_env), args.cache
+            )
+            print(f"Serveur lancé sur {server.url} (journal : {server.log_path})")
+        url, pid = (args.url, args.pid) if server is None else (server.url, server.pid)
+        try:
+            test = LoadTest(url, deliveries, args.email_share, args.choice, args.seed)
+            run = test.run(args.concurrency, args.rate, args.arrivals, args.requests, args.duration, pid, args.rss_interval)
+        finally:
+            if server is not None:
+                print(f"Rechargements du faux Alertmanager : {server.alertmanager.reloads}")
+                server.close()
+
+    stats = summary(run)
+    print(report(run, stats))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'summary': stats, **run}, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
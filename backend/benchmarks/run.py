@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from backend.benchmarks.synthetic import ANOMALY_KINDS, generate, write_delivery
+from backend.metrics import STAGE_DURATION, record_gauges
+from backend.scripts.anomaly_exports import collect_exports
+from backend.scripts.context import DatasetContext
+from backend.scripts.load_data import load_layers
+from backend.scripts.rules import required_columns, rules_for
+
+# Mesures de performance sur des livraisons synthétiques (voir synthetic.py), par tranche de taille :
+# durée de chaque règle exécutée seule, puis du traitement complet d'une livraison envoyée à /upload.
+# Le rapport donne, pour chaque règle, la durée médiane par tranche et l'exposant d'échelle
+# (pente log-log de la durée en fonction du nombre d'entités : 1 pour une règle linéaire).
+#
+#   python -m backend.benchmarks.run --sizes 500,2000,8000 --repeat 3 --output mesures.json
+#   python -m backend.benchmarks.run --sizes 500,2000,8000 --baseline mesures.json
+#
+# Les règles sont chronométrées sur les couches relues depuis les shapefiles, avec leurs seules
+# colonnes utiles comme dans le traitement, et un DatasetContext neuf à chaque exécution : chaque
+# règle paie les structures partagées (index, unions) qu'elle utilise
+
+PIPELINE_POLL_INTERVAL = 0.05
+# Exposant d'échelle au-delà duquel une règle est signalée
+SUPERLINEAR = 1.2
+
+
+def time_rules(layers, rules, repeat):
+    # {règle: {'function', 'seconds': [durées], 'anomalies'}} ; les messages des règles sont
+    # masqués, leurs jauges et couches d'anomalies relevées sans être publiées ni écrites
+    timings = {}
+    for rule in rules:
+        seconds, anomalies = [], 0
+        for _ in range(repeat):
+            ctx = DatasetContext({name: layers[name].copy() for name in rule.reads})
+            with record_gauges() as samples, collect_exports(), contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                rule.run(ctx)
+                seconds.append(time.perf_counter() - start)
+            anomalies = sum(value for name, _, value in samples if name == 'ANOMALY_COUNT')
+        timings[rule.keys[0]] = {'function': rule.name, 'seconds': seconds, 'anomalies': anomalies}
+    return timings
+
+
+def _stage_seconds():
+    # Durées cumulées de STAGE_DURATION par étape, toutes tranches de taille confondues
+    totals = {}
+    for sample in STAGE_DURATION.collect()[0].samples:
+        if sample.name.endswith('_sum'):
+            totals[sample.labels['stage']] = totals.get(sample.labels['stage'], 0) + sample.value
+    return totals
+
+
+def time_pipeline(client, zip_path, choice, repeat):
+    # Traitement complet par /upload : durée jusqu'au résultat, jusqu'à l'écriture des anomalies,
+    # et durée de chaque étape (STAGE_DURATION)
+    runs = {'seconds': [], 'exports_seconds': [], 'stages': {}}
+    for _ in range(repeat):
+        before = _stage_seconds()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            with open(zip_path, 'rb') as f:
+                response = client.post('/upload', data={
+                    'file': (f, 'livraison.zip'), 'choice': choice, 'email': 'benchmark@example.com', 'message': 'benchmark',
+                }, content_type='multipart/form-data')
+            job = response.get_json()
+            if response.status_code != 202:
+                raise RuntimeError(f"/upload a répondu {response.status_code} : {job}")
+            while job['status'] in ('queued', 'running'):
+                time.sleep(PIPELINE_POLL_INTERVAL)
+                job = client.get(f"/jobs/{job['job_id']}").get_json()
+            done = time.perf_counter() - start
+            while job.get('exports') == 'pending':
+                time.sleep(PIPELINE_POLL_INTERVAL)
+                job = client.get(f"/jobs/{job['job_id']}").get_json()
+            exported = time.perf_counter() - start
+        if job['status'] != 'done':
+            raise RuntimeError(f"Traitement {job['job_id']} en échec : {job.get('error')}")
+        runs['seconds'].append(done)
+        runs['exports_seconds'].append(exported)
+        for stage, seconds in _stage_seconds().items():
+            runs['stages'].setdefault(stage, []).append(seconds - before.get(stage, 0))
+    return runs
+
+
+def scaling_exponent(features, seconds):
+    # Pente de log(durée) en fonction de log(nombre d'entités), None sur moins de deux mesures
+    points = [(math.log(n), math.log(s)) for n, s in zip(features, seconds) if s > 0]
+    if len(points) < 2:
+        return None
+    x, y = zip(*points)
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def series(results):
+    # {nom: [durée médiane par tranche]} : règles, traitement complet et ses étapes
+    rows = {}
+    for tier in results['tiers']:
+        for name, entry in tier['rules'].items():
+            rows.setdefault(name, []).append(statistics.median(entry['seconds']))
+        if 'pipeline' in tier:
+            rows.setdefault('[traitement] résultat', []).append(statistics.median(tier['pipeline']['seconds']))
+            rows.setdefault('[traitement] exports', []).append(statistics.median(tier['pipeline']['exports_seconds']))
+            for stage, seconds in tier['pipeline']['stages'].items():
+                rows.setdefault(f"[étape] {stage}", []).append(statistics.median(seconds))
+    return rows
+
+
+def report(results, baseline=None):
+    features = [tier['features'] for tier in results['tiers']]
+    # Durées de référence indexées par (nom, nombre d'entités)
+    reference = {}
+    for tier_index, tier in enumerate((baseline or {}).get('tiers', [])):
+        for name, seconds in series(baseline).items():
+            reference[name, tier['features']] = seconds[tier_index]
+    width = max([len(name) for name in series(results)] + [10])
+    header = f"{'':{width}}" + ''.join(f"{n:>12,}" for n in features) + f"{'exposant':>10}"
+    lines = [f"Durées médianes (s) par nombre d'entités, livraison {results['choice'].upper()}", header]
+    for name, seconds in series(results).items():
+        exponent = scaling_exponent(features, seconds)
+        line = f"{name:{width}}" + ''.join(f"{s:12.3f}" for s in seconds)
+        line += f"{exponent:10.2f}" if exponent is not None else f"{'-':>10}"
+        if exponent is not None and exponent > SUPERLINEAR:
+            line += '  superlinéaire'
+        lines.append(line)
+        # Rapport à la mesure de référence pour les mêmes tailles
+        if any((name, n) in reference for n in features):
+            ratios = [
+                f"{s / reference[name, n]:11.2f}x" if reference.get((name, n)) else f"{'-':>12}"
+                for n, s in zip(features, seconds)
+            ]
+            lines.append(f"{'  / référence':{width}}" + ''.join(ratios))
+    anomalies = {name: entry['anomalies'] for name, entry in results['tiers'][-1]['rules'].items() if entry['anomalies']}
+    lines.append(f"Anomalies détectées sur la plus grande livraison : {anomalies or 'aucune'}")
+    return '\n'.join(lines)
+
+
+def plot(results, path):
+    # Courbes d'échelle log-log des règles et du traitement complet (matplotlib)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    features = [tier['features'] for tier in results['tiers']]
+    fig, ax = plt.subplots(figsize=(10, 7))
+    for name, seconds in series(results).items():
+        if not name.startswith('[étape]'):
+            ax.plot(features, seconds, marker='o', label=name, linewidth=2.5 if name.startswith('[traitement]') else 1)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel("Nombre d'entités de la livraison")
+    ax.set_ylabel('Durée médiane (s)')
+    ax.legend(fontsize=6, ncol=2)
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def run(sizes, choice='di', repeat=3, anomalies=1, pipeline=True, rule_names=None, seed=0):
+    rules = rules_for(choice)
+    if rule_names:
+        rules = [rule for rule in rules if rule.keys[0] in rule_names or rule.name in rule_names]
+    client = None
+    if pipeline:
+        # Application importée une fois les répertoires du traitement fixés ; sans cache des résultats,
+        # chaque répétition refait tout le traitement
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+        root = tempfile.mkdtemp(prefix='benchmark-')
+        for name in ('METRICS_DIR', 'EXPORT_DIR', 'FEATURE_STATE_DIR'):
+            os.environ.setdefault(name, os.path.join(root, name.lower()))
+        from backend.app import app
+        client = app.test_client()
+
+    results = {'choice': choice, 'repeat': repeat, 'anomalies': anomalies, 'seed': seed, 'tiers': []}
+    for n_pb in sizes:
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as directory:
+            start = time.perf_counter()
+            layers, injected = generate(n_pb, choice, anomalies, seed)
+            manifest, zip_path = write_delivery(layers, directory)
+            features = sum(len(gdf) for gdf in layers.values())
+            print(f"Livraison de {n_pb} PB : {features} entités, générée en {time.perf_counter() - start:.1f} s")
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                loaded, _ = asyncio.run(load_layers(manifest, required_columns(rules)))
+            tier = {'n_pb': n_pb, 'features': features, 'injected': {kind: len(codes) for kind, codes in injected.items()}}
+            tier['rules'] = time_rules(loaded, rules, repeat)
+            if client is not None:
+                tier['pipeline'] = time_pipeline(client, zip_path, choice, repeat)
+            results['tiers'].append(tier)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durées des règles et du traitement complet sur des livraisons synthétiques")
+    parser.add_argument('--sizes', default='500,2000,8000', help="nombres de PB des livraisons, séparés par des virgules")
+    parser.add_argument('--choice', default='di', choices=['di', 'tr'])
+    parser.add_argument('--repeat', type=int, default=3, help="exécutions par mesure (médiane)")
+    parser.add_argument('--anomalies', type=int, default=1, help=f"anomalies injectées de chaque type ({', '.join(ANOMALY_KINDS)})")
+    parser.add_argument('--rules', help="règles mesurées (clé ou fonction), séparées par des virgules ; toutes par défaut")
+    parser.add_argument('--no-pipeline', action='store_true', help="sans le traitement complet par /upload")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="fichier JSON des mesures")
+    parser.add_argument('--baseline', help="fichier JSON de mesures de référence, comparées tranche par tranche")
+    parser.add_argument('--plot', help="image des courbes d'échelle (matplotlib)")
+    args = parser.parse_args()
+
+    results = run(
+        [int(size) for size in args.sizes.split(',')], args.choice, args.repeat, args.anomalies,
+        not args.no_pipeline, args.rules.split(',') if args.rules else None, args.seed
+    )
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print(report(results, baseline))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Mesures écrites dans {args.output}")
+    if args.plot:
+        plot(results, args.plot)
+        print(f"Courbes écrites dans {args.plot}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+import math
+import os
+import zipfile
+import numpy as np
+import geopandas as gpd
+import shapely
+
+# Livraisons DI/TR synthétiques pour les mesures de performance (voir benchmarks/run.py) :
+# - zones imbriquées ZNRO > ZSRO > ZPA > ZPBO, les ZPA en grille dans la ZSRO et PB_PER_PA ZPBO par ZPA ;
+# - réseau arborescent sans croisement : NRO -> SRO, SRO -> premier PA de chaque rangée de ZPA,
+#   PA -> PA le long de la rangée, PA -> PB -> PB dans chaque ZPA ;
+# - chaque CB est couvert par des CM posés entre deux supports consécutifs (chambres, ou poteaux
+#   espacés de moins de 40 m pour les câbles aériens), raccordements RA du PB vers ses adresses.
+# Sans anomalie injectée, la livraison ne lève aucune anomalie
+
+CRS = 'EPSG:2154'
+# Coin bas gauche de la grille des ZPA (Lambert 93)
+ORIGIN = (650000, 6860000)
+ZPBO_WIDTH, ZPBO_HEIGHT = 40, 60
+PB_PER_PA = 8
+ZPA_WIDTH = ZPBO_WIDTH * PB_PER_PA
+# Bande de la ZSRO à gauche de la grille, où est placé le SRO ; marge de la ZNRO autour de la ZSRO
+SRO_MARGIN = 40
+NRO_MARGIN = 100
+# Espacement maximal des poteaux (câbles aériens) et des chambres (câbles souterrains)
+POLE_SPACING = 35
+CHAMBER_SPACING = 100
+# Part des rangées de PA et des ZPA dont les câbles sont aériens
+AERIAL_SHARE = 0.4
+
+# Anomalies injectables, chacune visant une règle (certaines en lèvent aussi d'autres, précisé entre parenthèses)
+ANOMALY_KINDS = (
+    'pbr_el',            # PBR à plus de 3 EL
+    'single_el',         # PB à 1 EL
+    'mic_pm',            # µm total de la ZSRO > 90
+    'mic_pa',            # µm FTTH de la ZPA > 20
+    'cm_length',         # CM de plus de 500 m
+    'd1_length',         # CB D1 de plus de 2100 m
+    'aerial_capacity',   # CB aérien de plus de 144 FO
+    'pa_on_enedis',      # PA posé sur un appui ENEDIS
+    'duplicate_code',    # ad_code en double
+    'pa_code',           # pcn_code de deux PA échangés (aussi PA hors zone)
+    'pcn_cb_ent',        # pcn_cb_ent du PA différent de la capacité du câble entrant
+    'pb_code',           # pcn_code de deux PB échangés : PB hors de leur ZPBO
+    'zpbo_zpa',          # ZPBO rattachée à une autre ZPA
+    'zone_overlap',      # ZPBO débordant sur ses voisines (aussi hors de sa ZPA)
+    'self_intersection', # CB qui se recoupe (aussi CB sans CM)
+    'cable_crossing',    # CB et CM croisant le câble de la rangée de PA hors d'un noeud
+    'cb_without_cm',     # CB sans CM
+    'support_gap',       # poteaux espacés de plus de 40 m
+    'cable_direction',   # câble PB -> PA
+)
+
+
+def _codes(prefix, values):
+    return np.array([f"{prefix}{value:07d}" for value in values], dtype=object)
+
+
+def _pick(rng, candidates, count, used):
+    # count éléments de candidates, hors used (mis à jour), dans un ordre aléatoire
+    candidates = np.asarray(candidates)
+    candidates = candidates[~np.isin(candidates, list(used))] if used else candidates
+    picked = rng.permutation(candidates)[:count]
+    used.update(picked.tolist())
+    return picked
+
+
+def generate(n_pb=1000, choice='di', anomalies=0, seed=0):
+    # Couches {nom: GeoDataFrame} d'une livraison de n_pb PB environ (arrondi au multiple de PB_PER_PA
+    # supérieur) et anomalies injectées {type: [codes concernés]} ; anomalies est un nombre par type
+    # (voir ANOMALY_KINDS) ou un dictionnaire {type: nombre}
+    counts = dict(anomalies) if isinstance(anomalies, dict) else dict.fromkeys(ANOMALY_KINDS, anomalies)
+    unknown = set(counts) - set(ANOMALY_KINDS)
+    if unknown:
+        raise ValueError(f"Anomalies inconnues : {sorted(unknown)}")
+    rng = np.random.default_rng(seed)
+    suffix = choice.upper()
+    injected = {kind: [] for kind, count in counts.items() if count}
+    used = {layer: set() for layer in ('PB', 'PA', 'ZPA', 'ZPBO', 'CB', 'CM', 'ADRESSE')}
+
+    # Grille de ZPA à peu près carrée, remplie rangée par rangée
+    n_pa = max(1, math.ceil(n_pb / PB_PER_PA))
+    cols = max(1, round(math.sqrt(n_pa * ZPBO_HEIGHT / ZPA_WIDTH)))
+    rows = math.ceil(n_pa / cols)
+    x0, y0 = ORIGIN
+    pa_row, pa_col = np.divmod(np.arange(n_pa), cols)
+    zpa_x = x0 + pa_col * ZPA_WIDTH
+    zpa_y = y0 + pa_row * ZPBO_HEIGHT
+    pa_xy = np.column_stack([zpa_x + 2, zpa_y + 2]).astype(float)
+
+    n_pb = n_pa * PB_PER_PA
+    pb_pa, pb_rank = np.divmod(np.arange(n_pb), PB_PER_PA)
+    zpbo_x = zpa_x[pb_pa] + pb_rank * ZPBO_WIDTH
+    zpbo_y = zpa_y[pb_pa]
+    pb_xy = np.column_stack([zpbo_x + ZPBO_WIDTH / 2, zpbo_y + 10]).astype(float)
+
+    zsro_box = (x0 - SRO_MARGIN, y0, x0 + cols * ZPA_WIDTH, y0 + rows * ZPBO_HEIGHT)
+    sro_xy = np.array([[x0 - SRO_MARGIN / 2, y0 + rows * ZPBO_HEIGHT // 2]], dtype=float)
+    nro_xy = np.array([[x0 - SRO_MARGIN - NRO_MARGIN / 2, sro_xy[0, 1]]])
+
+    # Câbles : (origine, extrémité, niveau, capacité, aérien)
+    row_heads = np.arange(rows) * cols
+    row_aerial = rng.random(rows) < AERIAL_SHARE
+    zpa_aerial = rng.random(n_pa) < AERIAL_SHARE
+    chained = np.flatnonzero((pa_col < cols - 1) & (np.arange(n_pa) + 1 < n_pa))
+    pb_next = np.flatnonzero(pb_rank < PB_PER_PA - 1)
+    parts = [
+        (nro_xy, sro_xy, 'TR', 288, np.zeros(1, dtype=bool)),
+        (np.repeat(sro_xy, rows, axis=0), pa_xy[row_heads], 'DI', 288, np.zeros(rows, dtype=bool)),
+        (pa_xy[chained], pa_xy[chained + 1], 'D1', 144, row_aerial[pa_row[chained]]),
+        (pa_xy, pb_xy[::PB_PER_PA], 'D2', 72, zpa_aerial),
+        (pb_xy[pb_next], pb_xy[pb_next + 1], 'D2', 36, zpa_aerial[pb_pa[pb_next]]),
+    ]
+    cb_start = np.concatenate([start for start, *_ in parts])
+    cb_end = np.concatenate([end for _, end, *_ in parts])
+    cb_level = np.concatenate([np.full(len(start), level, dtype=object) for start, _, level, *_ in parts])
+    cb_capafo = np.concatenate([np.full(len(start), capafo) for start, _, _, capafo, _ in parts])
+    cb_aerial = np.concatenate([aerial for *_, aerial in parts])
+    n_cb = len(cb_start)
+    first_d2 = n_cb - len(pb_next) - n_pa
+    pa_pb = np.arange(first_d2, first_d2 + n_pa)
+    pb_pb = np.arange(first_d2 + n_pa, n_cb)
+
+    # Poteaux deux fois trop espacés
+    spacing = np.where(cb_aerial, POLE_SPACING, CHAMBER_SPACING).astype(float)
+    if counts.get('support_gap'):
+        picked = _pick(rng, np.flatnonzero((cb_level == 'D1') & cb_aerial), counts['support_gap'], used['CB'])
+        spacing[picked] = 2 * POLE_SPACING
+
+    # Sommets des câbles : extrémités et supports intermédiaires régulièrement espacés
+    length = np.hypot(*(cb_end - cb_start).T)
+    pieces = np.maximum(1, np.ceil(length / spacing)).astype(int)
+    vertex_cb = np.repeat(np.arange(n_cb), pieces + 1)
+    vertex_rank = np.arange(len(vertex_cb)) - np.repeat(np.cumsum(pieces + 1) - pieces - 1, pieces + 1)
+    t = (vertex_rank / pieces[vertex_cb])[:, None]
+    vertex_xy = np.round(cb_start[vertex_cb] + t * (cb_end - cb_start)[vertex_cb], 2)
+    cb_geoms = shapely.linestrings(vertex_xy, indices=vertex_cb)
+
+    # Un CM entre deux sommets consécutifs de chaque CB
+    piece_start = np.flatnonzero(vertex_rank < pieces[vertex_cb])
+    cm_cb = vertex_cb[piece_start]
+    cm_geoms = shapely.linestrings(np.stack([vertex_xy[piece_start], vertex_xy[piece_start + 1]], axis=1))
+
+    # Supports : une chambre à chaque noeud, les sommets intermédiaires des câbles
+    intermediate = (vertex_rank > 0) & (vertex_rank < pieces[vertex_cb])
+    pole = cb_aerial[vertex_cb[intermediate]]
+    support_xy = np.concatenate([nro_xy, sro_xy, pa_xy, pb_xy, vertex_xy[intermediate]])
+    n_nodes = 2 + n_pa + n_pb
+    support_pole = np.concatenate([np.zeros(n_nodes, dtype=bool), pole])
+    n_poles = int(pole.sum())
+    support_newsup = np.full(len(support_xy), 'CHAMBRE', dtype=object)
+    support_newsup[support_pole] = rng.choice(['POTEAU BOIS', 'POTEAU METAL'], n_poles)
+    support_prop = np.full(len(support_xy), 'ORANGE', dtype=object)
+    support_prop[support_pole] = rng.choice(['ORANGE', 'ENEDIS'], n_poles, p=[0.7, 0.3])
+    pa_support = 2 + np.arange(n_pa)
+
+    # Adresses au-dessus de leur PB dans la ZPBO, raccordées par un CM RA
+    pb_addresses = rng.integers(1, 5, n_pb)
+    ad_pb = np.repeat(np.arange(n_pb), pb_addresses)
+    ad_xy = np.round(np.column_stack([
+        zpbo_x[ad_pb] + rng.uniform(4, ZPBO_WIDTH - 4, len(ad_pb)),
+        zpbo_y[ad_pb] + rng.uniform(30, ZPBO_HEIGHT - 5, len(ad_pb)),
+    ]), 2)
+    drop_geoms = shapely.linestrings(np.stack([pb_xy[ad_pb], ad_xy], axis=1))
+
+    # Attributs
+    pb_pbtyp = rng.choice(np.array(['PBO', 'PBR'], dtype=object), n_pb, p=[0.8, 0.2])
+    pb_ftth = np.where(pb_pbtyp == 'PBR', rng.integers(2, 4, n_pb), rng.integers(2, 13, n_pb))
+    pb_code = _codes('PB', np.arange(n_pb))
+    zpa_code = _codes('PA', np.arange(n_pa))
+    pa_code = zpa_code.copy()
+    zpa_umftth = rng.integers(1, 16, n_pa)
+    zsro_umtot = rng.integers(30, 81, 1)
+    zpbo_code = pb_code.copy()
+    zpbo_zpa = zpa_code[pb_pa]
+    zpbo_geoms = shapely.box(zpbo_x, zpbo_y, zpbo_x + ZPBO_WIDTH, zpbo_y + ZPBO_HEIGHT)
+    ad_code = _codes('AD', np.arange(len(ad_pb)))
+    cb_code = np.array([f"CB_{level}_{i:07d}" for i, level in enumerate(cb_level)], dtype=object)
+    cb_long = np.round(length, 1)
+    if counts.get('support_gap'):
+        injected['support_gap'] = cb_code[picked].tolist()
+    cm_code = _codes('CM', np.arange(len(cm_cb) + len(ad_pb)))
+    cm_long = np.round(shapely.length(np.concatenate([cm_geoms, drop_geoms])), 1)
+    cm_typelog = np.array([suffix] * len(cm_cb) + ['RA'] * len(ad_pb), dtype=object)
+    cm_keep = np.ones(len(cm_code), dtype=bool)
+
+    def inject(kind, layer, candidates, per_anomaly=1):
+        return _pick(rng, candidates, counts.get(kind, 0) * per_anomaly, used[layer])
+
+    for i in inject('pbr_el', 'PB', np.arange(n_pb)):
+        pb_pbtyp[i], pb_ftth[i] = 'PBR', rng.integers(4, 9)
+        injected['pbr_el'].append(pb_code[i])
+    for i in inject('single_el', 'PB', np.arange(n_pb)):
+        pb_pbtyp[i], pb_ftth[i] = 'PBO', 1
+        injected['single_el'].append(pb_code[i])
+    if counts.get('mic_pm'):
+        zsro_umtot[0] = rng.integers(91, 121)
+        injected['mic_pm'].append('ZS0000000')
+    for i in inject('mic_pa', 'ZPA', np.arange(n_pa)):
+        zpa_umftth[i] = rng.integers(21, 31)
+        injected['mic_pa'].append(pa_code[i])
+    for i in inject('cm_length', 'CM', np.arange(len(cm_cb))):
+        cm_long[i] = rng.integers(501, 1000)
+        injected['cm_length'].append(cm_code[i])
+    for i in inject('d1_length', 'CB', np.flatnonzero(cb_level == 'D1')):
+        cb_long[i] = rng.integers(2101, 3000)
+        injected['d1_length'].append(cb_code[i])
+    for i in inject('aerial_capacity', 'CB', pb_pb[cb_aerial[pb_pb]]):
+        cb_capafo[i] = 288
+        injected['aerial_capacity'].append(cb_code[i])
+    for i in inject('pa_on_enedis', 'PA', np.arange(n_pa)):
+        support_prop[pa_support[i]] = 'ENEDIS'
+        injected['pa_on_enedis'].append(pa_code[i])
+    for i in inject('duplicate_code', 'ADRESSE', np.arange(1, len(ad_code))):
+        ad_code[i] = ad_code[i - 1]
+        injected['duplicate_code'].append(ad_code[i])
+    # Codes échangés deux à deux : un tirage de longueur impaire perd son dernier élément
+    picked = inject('pa_code', 'PA', np.arange(n_pa), 2)
+    for pair in picked[:len(picked) // 2 * 2].reshape(-1, 2):
+        pa_code[pair] = pa_code[pair[::-1]]
+        injected['pa_code'].extend(pa_code[pair].tolist())
+    picked = inject('pb_code', 'PB', np.arange(n_pb), 2)
+    for pair in picked[:len(picked) // 2 * 2].reshape(-1, 2):
+        pb_code[pair] = pb_code[pair[::-1]]
+        injected['pb_code'].extend(pb_code[pair].tolist())
+    for i in inject('zpbo_zpa', 'ZPBO', np.arange(n_pb)):
+        zpbo_zpa[i] = zpa_code[(pb_pa[i] + 1) % n_pa] if n_pa > 1 else 'PA_INCONNUE'
+        injected['zpbo_zpa'].append(zpbo_code[i])
+    for i in inject('zone_overlap', 'ZPBO', np.arange(n_pb)):
+        zpbo_geoms[i] = shapely.buffer(zpbo_geoms[i], 5, join_style='mitre')
+        injected['zone_overlap'].append(zpbo_code[i])
+
+    underground_pb_pb = pb_pb[~cb_aerial[pb_pb]]
+    for i in inject('self_intersection', 'CB', underground_pb_pb):
+        (x, y), (end_x, _) = cb_start[i], cb_end[i]
+        cb_geoms[i] = shapely.LineString([(x, y), (x + 25, y), (x + 20, y + 5), (x + 20, y - 5), (end_x, y)])
+        injected['self_intersection'].append(cb_code[i])
+    for i in inject('cb_without_cm', 'CB', underground_pb_pb):
+        cm_keep[:len(cm_cb)][cm_cb == i] = False
+        injected['cb_without_cm'].append(cb_code[i])
+    for i in inject('cable_direction', 'CB', pa_pb):
+        cb_geoms[i] = shapely.reverse(cb_geoms[i])
+        injected['cable_direction'].append(cb_code[i])
+
+    # Câble vertical du dernier PB d'une ZPA vers celui de la ZPA du dessous, qui croise le câble
+    # de la rangée de PA entre deux supports
+    crossing = inject('cable_crossing', 'ZPA', np.flatnonzero((pa_row > 0) & np.isin(np.arange(n_pa), chained)))
+    crossing_pb = crossing * PB_PER_PA + PB_PER_PA - 1
+    crossing_geoms = shapely.linestrings(np.stack([pb_xy[crossing_pb], pb_xy[crossing_pb - cols * PB_PER_PA]], axis=1))
+    crossing_cb = [f"CB_D2_{n_cb + i:07d}" for i in range(len(crossing))]
+    crossing_cm = [f"CM{len(cm_code) + i:07d}" for i in range(len(crossing))]
+    if len(crossing):
+        injected['cable_crossing'] = crossing_cb
+
+    # Capacité entrante de chaque PA : le plus gros câble qui y arrive ou en part
+    d1 = np.flatnonzero(cb_level == 'D1')
+    pa_of = np.concatenate([row_heads, chained, chained + 1, np.arange(n_pa)])
+    cables = np.concatenate([np.flatnonzero(cb_level == 'DI'), d1, d1, pa_pb])
+    pcn_cb_ent = np.zeros(n_pa, dtype=int)
+    np.maximum.at(pcn_cb_ent, pa_of, cb_capafo[cables])
+    for i in inject('pcn_cb_ent', 'PA', np.arange(n_pa)):
+        pcn_cb_ent[i] = 12
+        injected['pcn_cb_ent'].append(pa_code[i])
+
+    def layer(columns, geometry):
+        return gpd.GeoDataFrame(columns, geometry=geometry, crs=CRS)
+
+    sro_code, nro_code = 'SRO0000000', 'NRO0000000'
+    n_support = len(support_xy)
+    cm_all_geoms = np.concatenate([cm_geoms, drop_geoms])
+    layers = {
+        'ZNRO': layer({'zn_code': ['ZN0000000'], 'zn_nd_code': [nro_code]}, [shapely.box(
+            zsro_box[0] - NRO_MARGIN, zsro_box[1] - NRO_MARGIN, zsro_box[2] + NRO_MARGIN, zsro_box[3] + NRO_MARGIN
+        )]),
+        'ZSRO': layer({'zs_code': ['ZS0000000'], 'zs_nd_code': [sro_code], 'pcn_umtot': zsro_umtot}, [shapely.box(*zsro_box)]),
+        'ZPA': layer({'pcn_code': zpa_code, 'pcn_umftth': zpa_umftth}, shapely.box(
+            zpa_x, zpa_y, zpa_x + ZPA_WIDTH, zpa_y + ZPBO_HEIGHT
+        )),
+        'ZPBO': layer({'pcn_code': zpbo_code, 'pcn_zpa': zpbo_zpa}, zpbo_geoms),
+        'NRO': layer({'nd_code': [nro_code]}, shapely.points(nro_xy)),
+        'SRO': layer({'nd_code': [sro_code]}, shapely.points(sro_xy)),
+        'PA': layer({'pcn_code': pa_code, 'pcn_cb_ent': pcn_cb_ent}, shapely.points(pa_xy)),
+        'PB': layer({'pcn_code': pb_code, 'pcn_pbtyp': pb_pbtyp, 'pcn_ftth': pb_ftth}, shapely.points(pb_xy)),
+        'ADRESSE': layer({'ad_code': ad_code}, shapely.points(ad_xy)),
+        'SUPPORT': layer({
+            'pt_codeext': _codes('PT', np.arange(n_support)),
+            'pcn_id': np.arange(1, n_support + 1),
+            'pcn_newsup': support_newsup,
+            'pt_prop': support_prop,
+        }, shapely.points(support_xy)),
+        f'CB_{suffix}': layer({
+            'cl_codeext': np.concatenate([cb_code, crossing_cb]),
+            'cb_capafo': np.concatenate([cb_capafo, np.full(len(crossing), 36)]),
+            'cb_long': np.concatenate([cb_long, np.round(shapely.length(crossing_geoms), 1)]),
+            'nd_r4_code': sro_code,
+        }, np.concatenate([cb_geoms, crossing_geoms])),
+        f'CM_{suffix}': layer({
+            'cm_codeext': np.concatenate([cm_code[cm_keep], crossing_cm]),
+            'cm_long': np.concatenate([cm_long[cm_keep], np.round(shapely.length(crossing_geoms), 1)]),
+            'cm_typelog': np.concatenate([cm_typelog[cm_keep], [suffix] * len(crossing)]),
+        }, np.concatenate([cm_all_geoms[cm_keep], crossing_geoms])),
+        # Points d'éclatement en tête de chaque rangée, conduites créées le long des câbles du SRO
+        f'PEP_{suffix}': layer({'pcn_code': _codes('PEP', np.arange(rows))}, shapely.points(pa_xy[row_heads])),
+        f'CREATION_CONDUITE_{suffix}': layer(
+            {'cm_codeext': cm_code[:len(cm_cb)][cb_level[cm_cb] == 'DI']},
+            cm_geoms[cb_level[cm_cb] == 'DI']
+        ),
+    }
+    return layers, injected
+
+
+def write_delivery(layers, directory):
+    # Shapefiles de la livraison dans directory et archive ZIP de ces fichiers, telle qu'envoyée à
+    # /upload : ({couche: chemin du .shp}, chemin de l'archive)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, gdf in layers.items():
+        manifest[name] = os.path.join(directory, f"{name}.shp")
+        gdf.to_file(manifest[name], engine='pyogrio')
+    zip_path = os.path.join(directory, 'livraison.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename in sorted(os.listdir(directory)):
+            if filename != 'livraison.zip':
+                archive.write(os.path.join(directory, filename), filename)
+    return manifest, zip_path
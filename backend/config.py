@@ -1,4 +1,42 @@
+import os
 import tempfile
 
 TEMP_DIR = tempfile.mkdtemp()
-DELETE_INTERVAL = 3600
\ No newline at end of file
+# Un sous-répertoire par traitement de livraison
+JOBS_DIR = os.path.join(TEMP_DIR, 'jobs')
+DELETE_INTERVAL = 3600
+# Nombre de règles de vérification exécutées en parallèle pour une livraison
+RULE_WORKERS = int(os.environ.get('RULE_WORKERS', os.cpu_count() or 1))
+# Exécution des règles : 'thread' (pool de threads) ou 'process' (pool de processus, couches en mémoire partagée)
+EXECUTION_MODE = os.environ.get('EXECUTION_MODE', 'thread')
+# Taille des blocs lors de l'enregistrement d'une livraison reçue
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Traitements de livraisons exécutés simultanément ; les jauges de chaque traitement sont relevées à part (METRICS_DIR)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+# Livraisons en attente au-delà desquelles /upload refuse les nouvelles (503)
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+# Cache des résultats de règles, conservé entre les redémarrages ; taille maximale en octets (0 le désactive)
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'verification-cache'))
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256 * 1024 * 1024))
+# États des vérifications géométriques par traitement, repris par une livraison qui référence ce traitement
+FEATURE_STATE_DIR = os.environ.get('FEATURE_STATE_DIR', os.path.join(tempfile.gettempdir(), 'verification-features'))
+# Durée de conservation de ces états, en secondes
+FEATURE_STATE_MAX_AGE = int(os.environ.get('FEATURE_STATE_MAX_AGE', 30 * 24 * 3600))
+# GeoPackage des anomalies de chaque traitement (anomalies_<traitement>.gpkg)
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(os.path.expanduser('~'), 'Downloads'))
+# Jauges par entité (codes, valeurs en double...) : 'detailed' les exporte toutes, 'bounded' n'exporte
+# que les METRICS_TOP_K plus fortes valeurs de chacune ; le détail reste servi par /jobs/<id>/anomalies
+METRICS_MODE = os.environ.get('METRICS_MODE', 'detailed')
+METRICS_TOP_K = int(os.environ.get('METRICS_TOP_K', 20))
+# Jauges de chaque traitement (un fichier par traitement), exposées avec un label job_id par tous les
+# processus serveurs qui partagent ce répertoire
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'verification-metrics'))
+# Traitements exposés : les METRICS_MAX_JOBS plus récents, terminés depuis moins de METRICS_RETENTION secondes
+METRICS_RETENTION = int(os.environ.get('METRICS_RETENTION', 24 * 3600))
+METRICS_MAX_JOBS = int(os.environ.get('METRICS_MAX_JOBS', 20))
+# Configuration d'Alertmanager modifiée par /save-email, rechargée ensuite par cette URL
+ALERTMANAGER_CONFIG_PATH = os.environ.get('ALERTMANAGER_CONFIG_PATH', r"C:/prometheus/alertmanager.yml")
+ALERTMANAGER_RELOAD_URL = os.environ.get('ALERTMANAGER_RELOAD_URL', "http://localhost:9093/-/reload")
+# Ports de l'application et du serveur de métriques Prometheus (python -m backend.app)
+APP_PORT = int(os.environ.get('APP_PORT', 5000))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 8000))
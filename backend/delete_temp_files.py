@@ -1,6 +1,10 @@
 import os
 import time
-from backend.config import TEMP_DIR, DELETE_INTERVAL
+from backend.config import TEMP_DIR, DELETE_INTERVAL, FEATURE_STATE_DIR, FEATURE_STATE_MAX_AGE
+from backend.workspace import delete_old_workspaces
+from backend.jobs import job_queue
+from backend.job_metrics import job_metrics
+from backend.exports import export_writer
 
 def delete_temp_files():
     while True:
@@ -12,4 +16,10 @@ def delete_temp_files():
                     os.unlink(file_path)
                     print(f"Deleted {file_path}")
             except Exception as e:
-                print(f"Error deleting file {file_path}: {e}")
\ No newline at end of file
+                print(f"Error deleting file {file_path}: {e}")
+        delete_old_workspaces(DELETE_INTERVAL)
+        delete_old_workspaces(FEATURE_STATE_MAX_AGE, FEATURE_STATE_DIR)
+        job_queue.purge(DELETE_INTERVAL)
+        job_metrics.purge()
+        # GeoPackages d'anomalies des traitements purgés, qui ne sont plus téléchargeables
+        export_writer.purge(DELETE_INTERVAL)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from backend.config import EXPORT_DIR
+from backend.metrics import STAGE_DURATION
+from backend.scripts.anomaly_exports import write_geopackage
+
+
+class ExportWriter:
+    # Écrit les couches d'anomalies de chaque traitement dans un GeoPackage, une fois la vérification
+    # terminée et hors du thread de traitement ; un seul thread d'écriture, les fichiers étant écrits
+    # l'un après l'autre
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f"anomalies_{job_id}.gpkg")
+
+    def submit(self, job_id, layers, on_done, size):
+        # on_done(**champs) reçoit l'état de l'export : exports 'none', 'pending', 'ready' ou 'failed' ;
+        # size est la tranche de taille de la livraison, label de la durée d'écriture
+        if not layers:
+            on_done(exports='none', export_layers=[])
+            return
+        on_done(exports='pending', export_layers=list(layers))
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write():
+            start = time.perf_counter()
+            try:
+                write_geopackage(self.path(job_id), layers)
+                STAGE_DURATION.labels(stage='export', size=size).observe(time.perf_counter() - start)
+            except Exception:
+                traceback.print_exc()
+                on_done(exports='failed')
+            else:
+                on_done(exports='ready')
+
+        self._executor.submit(write)
+
+    def purge(self, max_age):
+        # Supprime les GeoPackages (et fichiers temporaires laissés) plus anciens que max_age
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, 'anomalies_*.gpkg')):
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    print(f"Deleted {path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error deleting export {path}: {e}")
+
+
+export_writer = ExportWriter(EXPORT_DIR)
@@ -0,0 +1,116 @@
+import glob
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from prometheus_client.core import GaugeMetricFamily
+from backend.config import METRICS_DIR, METRICS_MAX_JOBS, METRICS_RETENTION
+from backend.metrics import BoundedGauge, gauges
+
+
+class JobMetrics:
+    # Jauges d'anomalies relevées pour chaque traitement (voir record_gauges), enregistrées dans un
+    # fichier par traitement et exposées avec un label job_id : des traitements simultanés ne
+    # s'écrasent pas, et chaque processus serveur lisant le même répertoire expose les mêmes séries.
+    # Seuls les max_jobs traitements les plus récents de moins de max_age secondes sont exposés.
+
+    def __init__(self, directory, max_age, max_jobs):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        # Fichiers déjà lus : {chemin: (date de modification, jauges)}
+        self._loaded = {}
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def publish(self, job_id, samples):
+        # samples : jauges relevées pour le traitement, sous la forme de record_gauges()
+        registered = gauges()
+        data = json.dumps([(registered[name]._name, labels, value) for name, labels, value in samples])
+        os.makedirs(self.directory, exist_ok=True)
+        # Écriture dans un fichier temporaire puis renommage : un processus ne lit jamais un fichier à moitié écrit
+        path = self._path(job_id)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _recent(self):
+        now = time.time()
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if now - mtime <= self.max_age:
+                entries.append((mtime, path))
+        return heapq.nlargest(self.max_jobs, entries)
+
+    def snapshots(self):
+        # [(job_id, [(métrique, labels, valeur)])] des traitements exposés
+        entries = self._recent()
+        snapshots = []
+        with self._lock:
+            for mtime, path in entries:
+                loaded = self._loaded.get(path)
+                if loaded is None or loaded[0] != mtime:
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            loaded = (mtime, json.load(f))
+                    except (OSError, ValueError) as e:
+                        print(f"Jauges illisibles {path} : {e}")
+                        continue
+                    self._loaded[path] = loaded
+                snapshots.append((os.path.basename(path)[:-len('.json')], loaded[1]))
+            self._loaded = {path: self._loaded[path] for _, path in entries if path in self._loaded}
+        return snapshots
+
+    def collect(self):
+        registered = {gauge._name: gauge for gauge in gauges().values()}
+        families = {
+            name: GaugeMetricFamily(name, gauge._documentation, labels=['job_id', *gauge._labelnames])
+            for name, gauge in registered.items()
+        }
+        for job_id, samples in self.snapshots():
+            series = {name: [] for name in registered}
+            for name, labels, value in samples:
+                if name in series:
+                    series[name].append((labels, value))
+            for name, gauge in registered.items():
+                values = series[name]
+                if not gauge._labelnames:
+                    # Jauge sans label non écrite par le traitement : 0, comme après clear_gauges()
+                    families[name].add_metric([job_id], sum(value for _, value in values))
+                    continue
+                if isinstance(gauge, BoundedGauge) and gauge.top_k is not None:
+                    values = heapq.nsmallest(
+                        gauge.top_k, values, key=lambda item: (-item[1], [item[0][label] for label in gauge._labelnames])
+                    )
+                for labels, value in values:
+                    families[name].add_metric([job_id, *(labels[label] for label in gauge._labelnames)], value)
+        return list(families.values())
+
+    def register(self, registry):
+        # Les jauges d'anomalies sont exposées par traitement, à la place de leurs valeurs dans ce processus
+        for gauge in gauges().values():
+            registry.unregister(gauge)
+        registry.register(self)
+
+    def purge(self):
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error deleting metrics file {path}: {e}")
+
+
+job_metrics = JobMetrics(METRICS_DIR, METRICS_RETENTION, METRICS_MAX_JOBS)
@@ -0,0 +1,84 @@
+import asyncio
+import queue
+import threading
+import time
+import traceback
+from backend.config import JOB_QUEUE_SIZE, JOB_WORKERS
+
+
+class JobFailed(Exception):
+    # Échec attendu d'un traitement (livraison incomplète...), renvoyé tel quel au client
+    pass
+
+
+class JobQueue:
+    # File bornée de traitements de livraisons, vidée par un nombre fixe de threads ; l'état de
+    # chaque traitement reste consultable jusqu'à purge()
+
+    def __init__(self, workers, max_pending):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._threads = []
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(target=self._work, name=f'job-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_id, run, **info):
+        # run est une fonction coroutine sans argument ; lève queue.Full si la file est pleine
+        self._start()
+        job = {'job_id': job_id, 'status': 'queued', 'submitted_at': time.time(), **info}
+        with self._lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait((job_id, run))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        # Sans effet pour un traitement déjà purgé
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _work(self):
+        while True:
+            job_id, run = self._queue.get()
+            self.update(job_id, status='running', started_at=time.time())
+            try:
+                result = asyncio.run(run())
+                self.update(job_id, status='done', finished_at=time.time(), result=result)
+            except JobFailed as e:
+                self.update(job_id, status='failed', finished_at=time.time(), error=str(e))
+            except Exception as e:
+                traceback.print_exc()
+                self.update(job_id, status='failed', finished_at=time.time(), error=f"Erreur interne : {e}")
+            finally:
+                self._queue.task_done()
+
+    def purge(self, max_age):
+        # Oublie les traitements terminés depuis plus de max_age secondes
+        now = time.time()
+        with self._lock:
+            for job_id in [
+                job_id for job_id, job in self._jobs.items()
+                if job.get('finished_at') is not None and now - job['finished_at'] > max_age
+            ]:
+                del self._jobs[job_id]
+
+
+job_queue = JobQueue(JOB_WORKERS, JOB_QUEUE_SIZE)
@@ -1,9 +1,56 @@
-from prometheus_client import Counter, Gauge, Info
+import contextlib
+import contextvars
+import time
+from prometheus_client import Counter, Histogram, Info
+from prometheus_client import Gauge as PrometheusGauge
+
+# Écritures de jauges relevées pour la règle ou le traitement en cours (voir record_gauges)
+_recorded = contextvars.ContextVar('recorded_gauges', default=None)
+
+
+def _record(name, labels, value, add):
+    # Reporte une écriture dans l'enregistrement actif du contexte ; False s'il n'y en a pas
+    recorded = _recorded.get()
+    if recorded is None:
+        return False
+    key = (name, labels)
+    recorded[key] = recorded.get(key, 0) + value if add else float(value)
+    return True
+
+
+class Gauge(PrometheusGauge):
+    # Jauge Prometheus dont les écritures, pendant un enregistrement actif du contexte, sont relevées
+    # dans cet enregistrement au lieu de modifier la jauge : les traitements simultanés ne se
+    # mélangent pas
+
+    def inc(self, amount=1):
+        if not self._record(amount, True):
+            super().inc(amount)
+
+    def dec(self, amount=1):
+        if not self._record(-amount, True):
+            super().dec(amount)
+
+    def set(self, value):
+        if not self._record(value, False):
+            super().set(value)
+
+    def _record(self, value, add):
+        return _record(self._name, tuple(zip(self._labelnames, self._labelvalues)), value, add)
+
+
+class BoundedGauge(Gauge):
+    # Jauge à un label par entité (code, valeur en double...) : une grosse livraison en crée des
+    # dizaines de milliers de séries. Avec top_k (METRICS_MODE='bounded'), seules les top_k séries de
+    # plus forte valeur de chaque traitement sont exportées (voir job_metrics.py) ; le détail complet
+    # est servi par /jobs/<id>/anomalies
+    top_k = None
+
 
 ANOMALY_COUNT = Gauge('anomaly_count', 'Nombre d’anomalies détectées lors de la dernière exécution')
-DUPLICATE_COUNT = Gauge('duplicate_count', 'Nombre de doublons détectés', ['file_key', 'column_name', 'duplicate_value'])
+DUPLICATE_COUNT = BoundedGauge('duplicate_count', 'Nombre de doublons détectés', ['file_key', 'column_name', 'duplicate_value'])
 
-NOT_IN_ZONE = Gauge(
+NOT_IN_ZONE = BoundedGauge(
     'not_in_zone',
     'Indicator that a geometry fell outside its assigned zone (0 or 1)',
     ['zone_type', 'code']
@@ -13,67 +60,67 @@ LONG_CONN_PERCENT = Gauge(
     'long_connections_percentage',
     'Pourcentage de raccordements RA dont la longueur > 90 m'
 )
-LONG_CONN_CM_LENGTH = Gauge(
+LONG_CONN_CM_LENGTH = BoundedGauge(
     'long_connections_cm_length',
     'Longueur des raccordements CM dépassant 500 mètres',
     ['cm_codeext']
 )
-CB_CAPAFO_EXCESS = Gauge(
+CB_CAPAFO_EXCESS = BoundedGauge(
     'cb_aerial_capacity_excess',
     'Capacité des câbles aériens dépassant 144 FO',
     ['cl_codeext']
 )
-PA_UMFTTH_EXCESS = Gauge(
+PA_UMFTTH_EXCESS = BoundedGauge(
     'pa_umftth_excess',
     'Valeur du µm FTTH dépassant 20 µm par PA',
     ['pcn_code']
 )
-SRO_UMTOT_EXCESS = Gauge(
+SRO_UMTOT_EXCESS = BoundedGauge(
     'sro_umtot_excess',
     'Valeur du µm TOTALE dépassant 90 µm par PM',
     ['zs_code']
 )
-CB_D1_LENGTH_EXCESS = Gauge(
+CB_D1_LENGTH_EXCESS = BoundedGauge(
     'cb_d1_length_excess',
     'Longueur des CB D1 dépassant 2100 mètres',
     ['cl_codeext']
 )
-PA_ON_ENEDIS_SUPPORT = Gauge(
+PA_ON_ENEDIS_SUPPORT = BoundedGauge(
     "pa_on_enedis_support",
     "PA superposé sur appui ENEDIS",
     ["pcn_code"]
 )
-ZPBO_NOT_IN_ZPA = Gauge(
+ZPBO_NOT_IN_ZPA = BoundedGauge(
     'zpbo_not_in_zpa',
     'Indicator that a zpbo fell outside its assigned zpa',
     ['zone_type', 'code']
 )
-SUPPORT_DISTANCE_EXCEEDING_MAX = Gauge(
+SUPPORT_DISTANCE_EXCEEDING_MAX = BoundedGauge(
     'support_distance_exceeding_max',
     'Distance between supports exceeding the maximum allowed distance',
     ['start_support_code', 'end_support_code']
 )
-ZPA_NOT_IN_ZSRO = Gauge(
+ZPA_NOT_IN_ZSRO = BoundedGauge(
     'zpa_not_in_zsro',
     'Indicator that a zpa fell outside its assigned zsro',
     ['zone_type', 'code']
 )
-ZSRO_NOT_IN_ZNRO = Gauge(
+ZSRO_NOT_IN_ZNRO = BoundedGauge(
     'zsro_not_in_znro',
     'Indicator that a zsro fell outside its assigned znro',
     ['zone_type', 'code']
 )
-PBR_EL_EXCESS = Gauge(
+PBR_EL_EXCESS = BoundedGauge(
     'pbr_el_excess',
     'PBRs associés à plus de 3 EL',
     ['pcn_code']
 )
-PB_SINGLE_EL = Gauge(
+PB_SINGLE_EL = BoundedGauge(
     'pb_single_el',
     'PBs à 1 EL',
     ['pcn_code']
 )
-INVALID_PCN_CODE_PA = Gauge(
+INVALID_PCN_CODE_PA = BoundedGauge(
     'invalid_pcn_code_pa',
     'Invalid pcn_code in PA table',
     ['pcn_code', 'expected_pcn_code']
@@ -82,7 +129,7 @@ MISSING_PCN_CODE_PA = Gauge(
     'missing_pcn_code_pa',
     'Nombre de lignes PA avec pcn_code manquant'
 )
-INVALID_PCN_CB_ENT_PA = Gauge(
+INVALID_PCN_CB_ENT_PA = BoundedGauge(
     'invalid_pcn_cb_ent_pa',
     'Invalid pcn_cb_ent in PA table',
     ['pcn_code', 'pcn_cb_ent_pa', 'expected_pcn_cb_ent_pa']
@@ -91,3 +138,122 @@ MISSING_PCN_CB_ENT_PA = Gauge(
     'missing_pcn_cb_ent_pa',
     'Nombre de lignes PA avec pcn_cb_ent_pa manquant'
 )
+# Nombre d'anomalies de chaque règle (incrément d'ANOMALY_COUNT par la règle), exporté dans tous les modes
+RULE_ANOMALY_COUNT = Gauge(
+    'rule_anomaly_count',
+    'Nombre d’anomalies détectées par règle lors de la dernière exécution',
+    ['rule']
+)
+
+
+# Durées du traitement des livraisons. Le label size est la tranche du nombre d'entités en entrée
+# (voir size_bucket) : le nombre exact ferait une série par livraison
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+STAGE_DURATION = Histogram(
+    'validation_stage_duration_seconds',
+    'Durée de chaque étape du traitement d’une livraison (upload, discovery, extract, digest, load, rules, export)',
+    ['stage', 'size'],
+    buckets=DURATION_BUCKETS
+)
+LAYER_LOAD_DURATION = Histogram(
+    'validation_layer_load_duration_seconds',
+    'Durée de lecture de chaque couche',
+    ['layer', 'size'],
+    buckets=DURATION_BUCKETS
+)
+RULE_DURATION = Histogram(
+    'validation_rule_duration_seconds',
+    'Durée d’exécution de chaque règle de vérification',
+    ['rule', 'size'],
+    buckets=DURATION_BUCKETS
+)
+
+SIZE_BUCKETS = ((1_000, '<1k'), (10_000, '1k-10k'), (100_000, '10k-100k'), (1_000_000, '100k-1M'))
+
+
+def size_bucket(features):
+    for limit, label in SIZE_BUCKETS:
+        if features < limit:
+            return label
+    return '>=1M'
+
+
+@contextlib.contextmanager
+def timed(timings, stage):
+    # Ajoute la durée du bloc à timings[stage] ; les durées sont observées une fois la taille connue
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+
+
+def observe_stages(timings, size):
+    for stage, seconds in timings.items():
+        STAGE_DURATION.labels(stage=stage, size=size).observe(seconds)
+
+
+def gauges():
+    return {name: value for name, value in globals().items() if isinstance(value, Gauge)}
+
+
+def clear_gauges():
+    for gauge in gauges().values():
+        if gauge._labelnames:
+            gauge.clear()
+        else:
+            gauge.set(0)
+
+
+def gauge_samples():
+    # Valeurs de toutes les séries des jauges (quel que soit top_k), sous forme transmissible entre
+    # processus : [(nom, labels, valeur)]
+    samples = []
+    for name, gauge in gauges().items():
+        if not gauge._labelnames:
+            samples.append((name, {}, gauge._value.get()))
+            continue
+        with gauge._lock:
+            metrics = list(gauge._metrics.items())
+        samples.extend((name, dict(zip(gauge._labelnames, labels)), metric._value.get()) for labels, metric in metrics)
+    return samples
+
+
+def anomaly_detail(samples):
+    # Séries des jauges par entité relevées pour un traitement : {métrique: [{labels..., value}]}
+    registered = gauges()
+    detail = {}
+    for name, labels, value in samples:
+        if labels and isinstance(registered[name], BoundedGauge):
+            detail.setdefault(registered[name]._name, []).append({**labels, 'value': value})
+    return detail
+
+
+def replay_gauge_samples(samples):
+    # Reporte les jauges d'une règle partie de zéro : les jauges à labels sont recopiées, les
+    # compteurs sans label (ANOMALY_COUNT...) sont ajoutés à la valeur courante
+    registered = gauges()
+    for name, labels, value in samples:
+        gauge = registered[name]
+        if labels:
+            # Dans un enregistrement, sans créer de série sur la jauge elle-même
+            if not _record(gauge._name, tuple((label, str(labels[label])) for label in gauge._labelnames), value, False):
+                gauge.labels(**labels).set(value)
+        elif value:
+            gauge.inc(value)
+
+
+@contextlib.contextmanager
+def record_gauges():
+    # Relève les écritures de jauges faites dans le contexte courant, sous la forme de gauge_samples()
+    # comme si les jauges étaient parties de zéro ; les jauges elles-mêmes ne sont pas modifiées et
+    # la liste est remplie à la sortie du bloc
+    recorded = {}
+    samples = []
+    token = _recorded.set(recorded)
+    try:
+        yield samples
+    finally:
+        _recorded.reset(token)
+        names = {gauge._name: name for name, gauge in gauges().items()}
+        samples.extend((names[metric], dict(labels), value) for (metric, labels), value in recorded.items())
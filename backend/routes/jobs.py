@@ -0,0 +1,81 @@
+from flask import Blueprint, jsonify, send_file
+import os, re
+import pyogrio
+from backend.jobs import job_queue
+from backend.exports import export_writer
+from backend.scripts.anomaly_exports import shapefile_archive
+from backend.scripts.profiling import profile_archive
+from backend.workspace import ANOMALY_DETAIL_FILE, PROFILE_DIR, workspace_path
+
+jobs_blueprint = Blueprint('jobs', __name__)
+
+
+@jobs_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Statut d'un traitement : queued, running, done (avec result) ou failed (avec error) ; exports
+    # indique l'état du GeoPackage des anomalies
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@jobs_blueprint.route('/jobs/<job_id>/anomalies', methods=['GET'])
+def job_anomalies(job_id):
+    # Séries par entité de toutes les jauges du traitement, y compris celles non exportées à
+    # Prometheus en METRICS_MODE 'bounded' : {métrique: [{labels..., value}]}
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    job = job_queue.get(job_id)
+    if job is not None and job['status'] in ('queued', 'running'):
+        return jsonify({"error": "Job not finished"}), 202, {'Retry-After': '2'}
+    path = os.path.join(workspace_path(job_id), ANOMALY_DETAIL_FILE)
+    if not os.path.exists(path):
+        return jsonify({"error": "No anomalies for this job"}), 404
+    return send_file(path, mimetype='application/json')
+
+
+@jobs_blueprint.route('/jobs/<job_id>/profile', methods=['GET'])
+def job_profile(job_id):
+    # Profil d'un traitement demandé avec profile : profils cProfile des règles, summary.json, report.txt
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    job = job_queue.get(job_id)
+    if job is not None and job['status'] in ('queued', 'running'):
+        return jsonify({"error": "Job not finished"}), 202, {'Retry-After': '2'}
+    directory = os.path.join(workspace_path(job_id), PROFILE_DIR)
+    if not os.path.exists(os.path.join(directory, 'summary.json')):
+        return jsonify({"error": "No profile for this job"}), 404
+    return send_file(profile_archive(directory), mimetype='application/zip', as_attachment=True, download_name=f"profile_{job_id}.zip")
+
+
+def _export_path(job_id):
+    # Chemin du GeoPackage d'un traitement, ou réponse d'erreur s'il n'est pas (encore) disponible
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None, (jsonify({"error": "Unknown job"}), 404)
+    job = job_queue.get(job_id)
+    if job is not None and job.get('exports') != 'ready' and job['status'] in ('queued', 'running') or (job or {}).get('exports') == 'pending':
+        return None, (jsonify({"error": "Export not ready"}), 202, {'Retry-After': '2'})
+    path = export_writer.path(job_id)
+    if not os.path.exists(path):
+        return None, (jsonify({"error": "No export for this job"}), 404)
+    return path, None
+
+
+@jobs_blueprint.route('/jobs/<job_id>/exports', methods=['GET'])
+def job_export(job_id):
+    path, error = _export_path(job_id)
+    if error:
+        return error
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+
+@jobs_blueprint.route('/jobs/<job_id>/exports/<layer>.zip', methods=['GET'])
+def job_export_shapefile(job_id, layer):
+    # Shapefile d'une couche d'anomalies, produit à la demande depuis le GeoPackage du traitement
+    path, error = _export_path(job_id)
+    if error:
+        return error
+    if layer not in pyogrio.list_layers(path)[:, 0]:
+        return jsonify({"error": "Unknown layer"}), 404
+    return send_file(shapefile_archive(path, layer), mimetype='application/zip', as_attachment=True, download_name=f"{layer}.zip")
@@ -0,0 +1,64 @@
+import contextlib
+import contextvars
+import io
+import os
+import tempfile
+import zipfile
+
+import geopandas as gpd
+
+# Couches d'anomalies relevées par les règles en cours d'exécution (voir collect_exports) ; elles sont
+# écrites une seule fois, après la vérification, dans un GeoPackage par traitement
+_collected = contextvars.ContextVar('collected_exports', default=None)
+
+
+@contextlib.contextmanager
+def collect_exports():
+    # Relève les couches passées à export_layer dans le contexte courant : {nom: GeoDataFrame}
+    layers = {}
+    token = _collected.set(layers)
+    try:
+        yield layers
+    finally:
+        _collected.reset(token)
+
+
+def export_layer(name, gdf):
+    layers = _collected.get()
+    if layers is not None:
+        layers[name] = gdf
+        return
+    # Règle appelée hors d'une vérification : la couche est écrite tout de suite, seule dans son fichier
+    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
+    os.makedirs(downloads, exist_ok=True)
+    write_geopackage(os.path.join(downloads, f"{name}.gpkg"), {name: gdf})
+
+
+def write_geopackage(path, layers):
+    # Une couche par anomalie dans un même GeoPackage, écrit à côté puis renommé : un fichier
+    # servi n'est jamais à moitié écrit
+    temp_path = f"{path}.tmp.gpkg"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        for name, gdf in layers.items():
+            gdf.to_file(temp_path, layer=name, driver='GPKG', engine='pyogrio')
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    print(f"{len(layers)} couches d'anomalies exportées dans {path}")
+
+
+def shapefile_archive(path, layer):
+    # Couche d'un GeoPackage convertie en shapefile, renvoyée sous forme d'archive ZIP en mémoire
+    gdf = gpd.read_file(path, layer=layer, engine='pyogrio')
+    buffer = io.BytesIO()
+    with tempfile.TemporaryDirectory() as directory:
+        gdf.to_file(os.path.join(directory, f"{layer}.shp"), driver='ESRI Shapefile', encoding='UTF-8', engine='pyogrio')
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename in sorted(os.listdir(directory)):
+                archive.write(os.path.join(directory, filename), filename)
+    buffer.seek(0)
+    return buffer
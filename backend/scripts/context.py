@@ -0,0 +1,90 @@
+import threading
+import numpy as np
+import pandas as pd
+import shapely
+from .spatial import ZoneAggregates, geometry_fingerprints, layers_tree, line_endpoints
+
+
+class _MemoEntry:
+    def __init__(self, gdfs):
+        self.gdfs = gdfs
+        self.lock = threading.Lock()
+        self.value = None
+        self.built = False
+
+
+class DatasetContext:
+    # Couches d'une livraison et structures qui en dérivent (reprojections, sous-ensembles, unions,
+    # géométries préparées, index), construites à la première demande puis partagées entre les règles
+
+    def __init__(self, layers=None, features=None):
+        self.layers = dict(layers or {})
+        # FeatureStore du traitement (voir incremental.py), None sans reprise des calculs
+        self.features = features
+        self.aggregates = ZoneAggregates()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        return self.layers[name]
+
+    def memo(self, key, build, *gdfs):
+        # Les couches sources font partie de la clé par identité et restent référencées par le cache ;
+        # une structure demandée par plusieurs règles en parallèle n'est construite qu'une fois
+        full_key = (key,) + tuple(id(gdf) for gdf in gdfs)
+        with self._lock:
+            entry = self._memo.setdefault(full_key, _MemoEntry(gdfs))
+        with entry.lock:
+            if not entry.built:
+                entry.value = build()
+                entry.built = True
+        return entry.value
+
+    def to_crs(self, gdf, crs):
+        if gdf.crs == crs:
+            return gdf
+        return self.memo(('to_crs', crs), lambda: gdf.to_crs(crs), gdf)
+
+    def subset(self, gdf, name, mask):
+        # Sous-ensemble nommé d'une couche, mask(gdf) renvoyant un masque booléen
+        return self.memo(('subset', name), lambda: gdf[np.asarray(mask(gdf), dtype=bool)], gdf)
+
+    def geometries(self, gdf):
+        # Géométries d'une couche sous forme de tableau, préparées pour les prédicats répétés
+        def build():
+            geoms = np.asarray(gdf.geometry.values, dtype=object)
+            shapely.prepare(geoms)
+            return geoms
+        return self.memo('geometries', build, gdf)
+
+    def union(self, gdf):
+        def build():
+            geom = shapely.union_all(np.asarray(gdf.geometry.values, dtype=object))
+            shapely.prepare(geom)
+            return geom
+        return self.memo('union', build, gdf)
+
+    def zones_by_code(self, zgdf, code):
+        # Une zone par code (la dernière lue l'emporte), dans l'ordre de première apparition du code
+        def build():
+            zones = zgdf.drop_duplicates(code, keep='last').set_index(code)
+            return zones.loc[pd.unique(zgdf[code])]
+        return self.memo(('zones_by_code', code), build, zgdf)
+
+    def layers_tree(self, *gdfs):
+        return self.memo('layers_tree', lambda: layers_tree(gdfs), *gdfs)
+
+    def fingerprints(self, gdf):
+        return self.memo('fingerprints', lambda: frozenset(geometry_fingerprints(gdf.geometry.values).tolist()), gdf)
+
+    def line_endpoints(self, gdf):
+        return self.memo('line_endpoints', lambda: line_endpoints(gdf), gdf)
+
+    def feature_state(self, name, context):
+        # État enregistré par la règle name lors du traitement de référence, s'il a été calculé
+        # avec les mêmes couches de contexte
+        return self.features.load(name, context) if self.features is not None else None
+
+    def save_feature_state(self, name, context, state):
+        if self.features is not None:
+            self.features.save(name, context, state)
@@ -1,8 +1,71 @@
 import aiofiles
+import hashlib
 import zipfile
 import os
 import asyncio
+from ..metrics import timed
 
-async def extract_zip(zip_path, extract_to):
+# Fichiers composant une couche shapefile ; les autres membres de l'archive (rasters, PDF...) ne sont pas extraits
+SHAPEFILE_EXTENSIONS = {'.shp', '.shx', '.dbf', '.prj', '.cpg'}
+
+
+async def save_upload(file, path, chunk_size):
+    # Copie le fichier reçu sur disque par blocs en calculant son empreinte SHA-256 au passage
+    digest = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(path, 'wb') as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            await f.write(chunk)
+    return digest.hexdigest(), size
+
+
+def member_layer(member_name, layers):
+    # Couche à laquelle appartient un membre de l'archive : nom de fichier identique à celui de la
+    # couche (à la casse près) et extension d'un fichier shapefile ; None sinon
+    stem, extension = os.path.splitext(os.path.basename(member_name))
+    if extension.lower() not in SHAPEFILE_EXTENSIONS:
+        return None
+    return layers.get(stem.upper())
+
+
+def _extract(zip_path, extract_to, layers, timings):
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        if layers is None:
+            with timed(timings, 'extract'):
+                archive.extractall(extract_to)
+            return None
+
+        # Recherche des fichiers des couches attendues parmi les membres de l'archive
+        with timed(timings, 'discovery'):
+            wanted = {layer.upper(): layer for layer in layers}
+            members = []
+            for info in archive.infolist():
+                layer = None if info.is_dir() else member_layer(info.filename, wanted)
+                if layer is not None:
+                    members.append((info, layer))
+
+        manifest = {}
+        with timed(timings, 'extract'):
+            for info, layer in members:
+                # ZipFile.extract neutralise les chemins absolus et les '..' des noms de membres
+                path = archive.extract(info, extract_to)
+                if os.path.splitext(path)[1].lower() == '.shp':
+                    if layer in manifest:
+                        print(f"Couche {layer} présente plusieurs fois dans l'archive, {manifest[layer]} est conservé")
+                    else:
+                        manifest[layer] = path
+        print(f"{len(members)} fichiers extraits sur {len(archive.infolist())} membres de l'archive")
+        return manifest
+
+
+async def extract_zip(zip_path, extract_to, layers=None, timings=None):
+    # Avec layers, seuls les fichiers de ces couches sont extraits et le manifeste
+    # {couche: chemin du .shp} est renvoyé ; timings reçoit les durées des étapes discovery et extract
     loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, zipfile.ZipFile(zip_path, 'r').extractall, extract_to)
\ No newline at end of file
+    timings = {} if timings is None else timings
+    return await loop.run_in_executor(None, _extract, zip_path, extract_to, layers, timings)
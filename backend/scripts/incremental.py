@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pickle
+import uuid
+import numpy as np
+import pandas as pd
+import shapely
+
+# Reprise des calculs géométriques d'une livraison de référence : chaque règle concernée enregistre,
+# par entité ou par paire d'entités, ce qu'elle a calculé avec l'empreinte (géométrie + clé) des
+# entités. Une livraison suivante ne recalcule que les entités nouvelles ou modifiées et les paires
+# qui en comportent une ; le reste est repris tel quel de la référence.
+
+# Nombre maximal de traitements de référence parcourus pour retrouver l'état d'une règle
+_REFERENCE_DEPTH = 10
+
+
+def row_fingerprints(gdf, columns=()):
+    # Empreinte de chaque entité : géométrie (WKB) et valeurs des colonnes données
+    wkb = shapely.to_wkb(np.asarray(gdf.geometry.values, dtype=object)).tolist()
+    values = list(zip(*(gdf[column].tolist() for column in columns))) if columns else [()] * len(gdf)
+    return np.array([
+        hashlib.blake2b((geom or b'') + repr(value).encode(), digest_size=16).digest()
+        for geom, value in zip(wkb, values)
+    ], dtype=object)
+
+
+def context_fingerprint(crs, *layers):
+    # Empreinte de la projection de calcul et des couches (gdf, colonnes) dont dépend le calcul d'une entité
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{crs}".encode())
+    for gdf, columns in layers:
+        digest.update(f"{gdf.crs}:{len(gdf)}:".encode())
+        for fingerprint in row_fingerprints(gdf, [column for column in columns if column]):
+            digest.update(fingerprint)
+    return digest.hexdigest()
+
+
+def match_rows(fingerprints, previous):
+    # Position dans la référence de chaque entité inchangée, -1 pour une entité nouvelle ou modifiée ;
+    # les entités présentes en double de part ou d'autre sont traitées comme modifiées
+    positions = pd.Series(np.arange(len(previous)), index=pd.Index(previous, dtype=object))
+    positions = positions[~positions.index.duplicated(keep=False)]
+    matched = positions.reindex(pd.Index(fingerprints, dtype=object)).fillna(-1).to_numpy(dtype=np.intp)
+    matched[pd.Index(fingerprints, dtype=object).duplicated(keep=False)] = -1
+    return matched
+
+
+def _pairs(left, right):
+    if not len(left):
+        empty = np.array([], dtype=np.intp)
+        return empty, empty
+    pairs = np.unique(np.stack([left, right], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def changed_pairs(gdf, changed, predicate='intersects'):
+    # Paires (i, j), i < j, vérifiant le prédicat et comportant au moins une entité de changed,
+    # triées comme candidate_pairs
+    rows = np.flatnonzero(changed)
+    if not len(rows):
+        return _pairs([], [])
+    query_idx, other = gdf.sindex.query(gdf.geometry.values[rows], predicate=predicate)
+    row = rows[query_idx]
+    keep = row != other
+    return _pairs(np.minimum(row, other)[keep], np.maximum(row, other)[keep])
+
+
+def split_pairs(gdf, fingerprints, previous, predicate='intersects'):
+    # Répartit les paires d'une couche entre paires à calculer (left, right) et enregistrements repris
+    # de previous (masque sur ses enregistrements, positions left et right dans la couche) ; une paire
+    # d'entités inchangées dont l'ordre s'est inversé est recalculée
+    position = match_rows(fingerprints, previous['fingerprints'])
+    unchanged = position >= 0
+    new_row = np.full(len(previous['fingerprints']), -1, dtype=np.intp)
+    new_row[position[unchanged]] = np.flatnonzero(unchanged)
+
+    reused_left, reused_right = new_row[previous['left']], new_row[previous['right']]
+    kept = (reused_left >= 0) & (reused_right >= 0)
+    flipped = kept & (reused_left > reused_right)
+    reused = kept & ~flipped
+
+    left, right = changed_pairs(gdf, ~unchanged, predicate)
+    if flipped.any():
+        left, right = _pairs(
+            np.concatenate([left, reused_right[flipped]]), np.concatenate([right, reused_left[flipped]])
+        )
+    return left, right, reused, reused_left[reused], reused_right[reused]
+
+
+def pairs_order(left, right):
+    # Ordre de candidate_pairs pour des enregistrements par paire, l'ordre au sein d'une paire conservé
+    return np.lexsort((np.arange(len(left)), right, left))
+
+
+class FeatureStore:
+    # États des règles d'un traitement, enregistrés dans directory ; reference est le répertoire du
+    # traitement de référence, dont les états sont repris (ou ceux de sa propre référence, à défaut)
+
+    def __init__(self, directory, reference=None):
+        self.directory = directory
+        self.reference = reference
+        os.makedirs(directory, exist_ok=True)
+        if reference:
+            with open(os.path.join(directory, 'reference'), 'w') as f:
+                f.write(reference)
+
+    def load(self, name, context):
+        directory = self.reference
+        for _ in range(_REFERENCE_DEPTH):
+            if not directory:
+                return None
+            try:
+                with open(os.path.join(directory, f"{name}.pickle"), 'rb') as f:
+                    state = pickle.load(f)
+                if state['context'] == context:
+                    return state
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"État {name} illisible dans {directory} : {e}")
+            try:
+                with open(os.path.join(directory, 'reference')) as f:
+                    directory = f.read()
+            except FileNotFoundError:
+                return None
+        return None
+
+    def save(self, name, context, state):
+        path = os.path.join(self.directory, f"{name}.pickle")
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump({**state, 'context': context}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
@@ -1,21 +1,71 @@
 import geopandas as gpd
 import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import shapely
+import pyogrio
+from ..metrics import LAYER_LOAD_DURATION, size_bucket
+
+try:
+    import pyarrow  # noqa: F401
+    USE_ARROW = True
+except ImportError:
+    USE_ARROW = False
+
+
+def read_layer(path, columns=None):
+    # Lecture pyogrio (flux Arrow quand pyarrow est disponible) ; columns restreint les attributs
+    # lus, les noms absents du fichier sont ignorés
+    start = time.perf_counter()
+    kwargs = {'engine': 'pyogrio', 'use_arrow': USE_ARROW}
+    if columns is not None:
+        kwargs['columns'] = list(columns)
+    gdf = gpd.read_file(path, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    # Mémoire approchée : attributs + coordonnées des géométries en double précision
+    coordinates = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    memory = int(gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum()) + coordinates * 16
+    return gdf, {
+        'path': path,
+        'rows': len(gdf),
+        'columns': len(gdf.columns) - 1,
+        'seconds': elapsed,
+        'bytes': memory,
+    }
+
+
+def feature_count(path):
+    # Nombre d'entités d'une couche, lu dans son en-tête sans charger les géométries
+    return pyogrio.read_info(path)['features']
+
+
+async def load_layers(paths, columns=None, max_workers=None):
+    # Lit toutes les couches en parallèle ; paths et columns sont indexés par nom de couche,
+    # une couche absente de columns est lue avec tous ses attributs
+    columns = columns or {}
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(paths) or 1, thread_name_prefix='load') as executor:
+        loaded = await asyncio.gather(*[
+            loop.run_in_executor(executor, read_layer, path, columns.get(name))
+            for name, path in paths.items()
+        ])
+
+    layers, report = {}, {}
+    for name, (gdf, stats) in zip(paths, loaded):
+        layers[name] = gdf
+        report[name] = stats
+        LAYER_LOAD_DURATION.labels(layer=name, size=size_bucket(stats['rows'])).observe(stats['seconds'])
+        print(f"Couche {name} ({os.path.basename(stats['path'])}) : {stats['rows']} entités, "
+              f"{stats['columns']} colonnes, {stats['seconds']:.2f} s, {stats['bytes'] / 1e6:.1f} Mo")
+    print(f"Chargement de {len(layers)} couches en {time.perf_counter() - start:.2f} s "
+          f"({sum(stats['bytes'] for stats in report.values()) / 1e6:.1f} Mo)")
+    return layers, report
+
 
 async def load_data(pb_path, zpbo_path, zsro_path, zpa_path, cb_di_path, pa_path, znro_path, adresse_path, cm_di_path, support_path, sro_path, nro_path, pep_di_path, creation_conduite_di_path):
-    loop = asyncio.get_event_loop()
-    pb_gdf = await loop.run_in_executor(None, gpd.read_file, pb_path)
-    zpbo_gdf = await loop.run_in_executor(None, gpd.read_file, zpbo_path)
-    zsro_gdf = await loop.run_in_executor(None, gpd.read_file, zsro_path)
-    zpa_gdf = await loop.run_in_executor(None, gpd.read_file, zpa_path)
-    cb_di_gdf = await loop.run_in_executor(None, gpd.read_file, cb_di_path)
-    pa_gdf = await loop.run_in_executor(None, gpd.read_file, pa_path)
-    znro_gdf = await loop.run_in_executor(None, gpd.read_file, znro_path)
-    adresse_gdf = await loop.run_in_executor(None, gpd.read_file, adresse_path)
-    cm_di_gdf = await loop.run_in_executor(None, gpd.read_file, cm_di_path)
-    support_gdf = await loop.run_in_executor(None, gpd.read_file, support_path)
-    sro_gdf = await loop.run_in_executor(None, gpd.read_file, sro_path)
-    nro_gdf = await loop.run_in_executor(None, gpd.read_file, nro_path)
-    pep_di_gdf = await loop.run_in_executor(None, gpd.read_file, pep_di_path)
-    creation_conduite_di_gdf = await loop.run_in_executor(None, gpd.read_file, creation_conduite_di_path)
-    
-    return pb_gdf, zpbo_gdf, zsro_gdf, zpa_gdf, cb_di_gdf, pa_gdf, znro_gdf, adresse_gdf, cm_di_gdf, support_gdf, sro_gdf, nro_gdf, pep_di_gdf, creation_conduite_di_gdf
\ No newline at end of file
+    paths = [pb_path, zpbo_path, zsro_path, zpa_path, cb_di_path, pa_path, znro_path, adresse_path, cm_di_path, support_path, sro_path, nro_path, pep_di_path, creation_conduite_di_path]
+    layers, _ = await load_layers(dict(enumerate(paths)))
+    return tuple(layers[i] for i in range(len(paths)))
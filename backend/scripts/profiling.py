@@ -0,0 +1,144 @@
+import contextlib
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import re
+import time
+import tracemalloc
+import zipfile
+
+# Profilage à la demande d'un traitement : profil CPU (cProfile), durée et temps CPU de chaque règle,
+# durée, temps CPU et pic mémoire (tracemalloc) de chaque étape. Sans profilage demandé, le traitement
+# utilise NullProfile et les règles reçoivent profile_dir=None : rien n'est mesuré en plus.
+
+# Fonctions listées par règle dans le rapport texte
+_REPORT_LINES = 25
+
+
+def _filename(name):
+    return re.sub(r'[^0-9A-Za-z_.-]+', '_', name)
+
+
+@contextlib.contextmanager
+def profile_rule(directory, name):
+    # Profil CPU de la règle dans directory/<nom>.prof, durées et pic mémoire dans directory/<nom>.json.
+    # Le pic mémoire n'est mesuré que si la règle a le processus pour elle seule (processus de calcul) :
+    # dans un thread, les règles voisines fausseraient la mesure, relevée alors pour toute l'étape
+    if directory is None:
+        yield
+        return
+    memory = not tracemalloc.is_tracing()
+    if memory:
+        tracemalloc.start()
+    profile = cProfile.Profile()
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        entry = {
+            'seconds': time.perf_counter() - start,
+            'cpu_seconds': time.thread_time() - cpu_start,
+            'peak_bytes': tracemalloc.get_traced_memory()[1] if memory else None,
+        }
+        if memory:
+            tracemalloc.stop()
+        os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(os.path.join(directory, f"{_filename(name)}.prof"))
+        with open(os.path.join(directory, f"{_filename(name)}.json"), 'w') as f:
+            json.dump(entry, f)
+
+
+class JobProfile:
+    # Profil d'un traitement, écrit dans directory : rules/<règle>.prof et .json, summary.json et report.txt.
+    # tracemalloc suit tout le processus serveur, de la création du profil à close() : tant qu'un
+    # traitement profilé tourne, les traitements simultanés (JOB_WORKERS > 1) sont eux aussi ralentis,
+    # et leurs allocations comptent dans les pics mémoire des étapes, alors approchés
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.rules_dir = os.path.join(directory, 'rules')
+        self.stages = {}
+        self.layers = {}
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                'seconds': time.perf_counter() - start,
+                'cpu_seconds': time.process_time() - cpu_start,
+                'peak_bytes': tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            }
+
+    def loaded(self, report):
+        # Statistiques de lecture des couches (voir load_layers)
+        self.layers.update(report)
+
+    def finish(self, timings):
+        # timings : durées des étapes du traitement (voir metrics.timed)
+        self.close()
+        rules = {}
+        for path in sorted(glob.glob(os.path.join(self.rules_dir, '*.json'))):
+            with open(path) as f:
+                rules[os.path.basename(path)[:-len('.json')]] = json.load(f)
+        summary = {'timings': timings, 'stages': self.stages, 'rules': rules, 'layers': self.layers}
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, default=str)
+
+        # Règles les plus longues d'abord, avec leurs fonctions les plus coûteuses (temps cumulé)
+        report = io.StringIO()
+        for name, entry in sorted(rules.items(), key=lambda item: -item[1]['seconds']):
+            report.write(f"=== {name} : {entry['seconds']:.2f} s, {entry['cpu_seconds']:.2f} s CPU\n")
+            stats = pstats.Stats(os.path.join(self.rules_dir, f"{name}.prof"), stream=report)
+            stats.sort_stats('cumulative').print_stats(_REPORT_LINES)
+        with open(os.path.join(self.directory, 'report.txt'), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        print(f"Profil du traitement écrit dans {self.directory}")
+
+    def close(self):
+        # Arrête tracemalloc s'il a été démarré par ce profil ; appelé aussi quand le traitement échoue
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+
+class NullProfile:
+    # Profilage désactivé : aucune mesure
+    rules_dir = None
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def loaded(self, report):
+        pass
+
+    def finish(self, timings):
+        pass
+
+    def close(self):
+        pass
+
+
+def profile_archive(directory):
+    # Profil d'un traitement sous forme d'archive ZIP en mémoire
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, _, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                archive.write(path, os.path.relpath(path, directory))
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,178 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import pickle
+import threading
+import uuid
+from ..metrics import RULE_ANOMALY_COUNT, gauges, replay_gauge_samples
+from .extract_zip import SHAPEFILE_EXTENSIONS
+from .scheduler import merge_results
+
+# Résultats des règles indexés par le contenu des couches qu'elles lisent : une livraison renvoyée
+# à l'identique, ou avec une seule couche modifiée, ne réexécute que les règles lisant une couche
+# modifiée. Chaque entrée est un fichier JSON {result, samples}, accompagné des couches d'anomalies
+# de la règle (pickle) quand elle en a produit ; les plus anciennement utilisées sont supprimées
+# au-delà de la taille maximale.
+
+
+def code_version():
+    # Empreinte du code des vérifications et des jauges qu'elles écrivent (metrics.py) : toute
+    # modification invalide les résultats en cache
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))) + [os.path.join(os.path.dirname(directory), 'metrics.py')]:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+CODE_VERSION = code_version()
+
+
+def layer_digest(shp_path):
+    # SHA-256 des fichiers d'une couche (.shp, .shx, .dbf, .prj, .cpg) extraits à côté du .shp
+    stem = os.path.splitext(shp_path)[0]
+    files = {}
+    for path in glob.glob(glob.escape(stem) + '.*'):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in SHAPEFILE_EXTENSIONS:
+            files[extension] = path
+    digest = hashlib.sha256()
+    for extension, path in sorted(files.items()):
+        digest.update(f"{extension}:{os.path.getsize(path)}:".encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def layer_digests(manifest):
+    loop = asyncio.get_running_loop()
+    digests = await asyncio.gather(*[loop.run_in_executor(None, layer_digest, path) for path in manifest.values()])
+    return dict(zip(manifest, digests))
+
+
+class ResultCache:
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, rule, digests):
+        # Règle (nom, clés, paramètres, colonnes) + code des vérifications + contenu des couches lues
+        description = json.dumps([
+            CODE_VERSION, rule.name, rule.keys, rule.extra,
+            sorted((layer, list(columns)) for layer, columns in rule.columns.items()),
+            [(layer, digests[layer]) for layer in rule.reads],
+        ], default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _layers_path(self, key):
+        return os.path.join(self.directory, f"{key}.layers")
+
+    def get(self, key):
+        # (résultat, jauges, couches d'anomalies) ou None ; une entrée lue est marquée comme
+        # récemment utilisée. Une entrée citant une jauge inconnue (renommée depuis) est ignorée
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            samples = [tuple(sample) for sample in entry['samples']]
+            registered = gauges()
+            if any(name not in registered for name, _, _ in samples):
+                return None
+            layers = {}
+            if entry.get('layers'):
+                with open(self._layers_path(key), 'rb') as f:
+                    layers = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, pickle.UnpicklingError) as e:
+            print(f"Entrée de cache illisible {path} : {e}")
+            return None
+        return entry['result'], samples, layers
+
+    def _write(self, path, data, mode):
+        # Écriture dans un fichier temporaire puis renommage : une entrée n'est jamais lue à moitié écrite
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, mode) as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def put(self, key, result, samples, layers):
+        try:
+            data = json.dumps({'result': result, 'samples': samples, 'layers': bool(layers)})
+        except (TypeError, ValueError) as e:
+            print(f"Résultat non mis en cache : {e}")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Les couches sont écrites avant l'entrée qui les annonce
+        if layers:
+            self._write(self._layers_path(key), pickle.dumps(layers, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+        self._write(self._path(key), data.encode('utf-8'), 'wb')
+
+    def evict(self):
+        # Supprime les entrées les moins récemment utilisées jusqu'à repasser sous la taille maximale
+        with self._lock:
+            entries = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                key = os.path.basename(path)[:-len('.json')]
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                size = stat.st_size
+                if os.path.exists(self._layers_path(key)):
+                    size += os.path.getsize(self._layers_path(key))
+                entries.append((stat.st_mtime, size, key))
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in [self._path(key), self._layers_path(key)]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+async def run_cached_rules(cache, rules, digests, execute):
+    # Les règles dont le résultat est en cache sont reprises avec leurs jauges et leurs couches
+    # d'anomalies ; execute(règles) exécute les autres et renvoie leurs (résultat, jauges, couches).
+    # Les règles qui modifient une couche sont toujours exécutées : les règles suivantes lisent la
+    # couche modifiée. Renvoie les résultats fusionnés, les couches d'anomalies et les jauges écrites
+    # par toutes les règles ; le nombre d'anomalies de chaque règle est reporté dans RULE_ANOMALY_COUNT.
+    keys = [None if cache is None or rule.writes else cache.key(rule, digests) for rule in rules]
+    outcomes = [None if key is None else cache.get(key) for key in keys]
+    pending = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    print(f"{len(rules) - len(pending)} règles reprises du cache, {len(pending)} à exécuter")
+
+    for outcome in outcomes:
+        if outcome is not None:
+            replay_gauge_samples(outcome[1])
+
+    if pending:
+        executed = await execute([rules[i] for i in pending])
+        for i, outcome in zip(pending, executed):
+            outcomes[i] = outcome
+            if keys[i] is not None:
+                cache.put(keys[i], *outcome)
+        if cache is not None:
+            cache.evict()
+
+    for rule, (_, samples, _) in zip(rules, outcomes):
+        count = sum(value for name, labels, value in samples if name == 'ANOMALY_COUNT')
+        RULE_ANOMALY_COUNT.labels(rule=rule.keys[0]).set(count)
+    return (
+        merge_results(result for result, _, _ in outcomes),
+        merge_results(layers for _, _, layers in outcomes),
+        [sample for _, samples, _ in outcomes for sample in samples],
+    )
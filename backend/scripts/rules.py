@@ -0,0 +1,187 @@
+import asyncio
+import inspect
+from functools import partial
+from .verify import *
+from .verify_di import *
+
+
+class Rule:
+    # Vérification déclarée avec les couches qu'elle lit (et modifie) et les colonnes attributaires
+    # qu'elle utilise : les clés de la réponse reçoivent le résultat de func appelée sur ces couches,
+    # suivies de extra
+
+    def __init__(self, keys, func, reads, extra=(), writes=(), columns=None, args=None):
+        self.keys = keys if isinstance(keys, tuple) else (keys,)
+        self.func = func
+        self.reads = tuple(reads)
+        self.writes = tuple(writes)
+        self.columns = {layer: tuple(names) for layer, names in (columns or {}).items()}
+        self.extra = tuple(extra)
+        self.args = args
+        self.uses_ctx = 'ctx' in inspect.signature(func).parameters
+
+    @property
+    def name(self):
+        return self.func.__name__
+
+    def conflicts(self, other):
+        # Deux règles ne peuvent tourner ensemble si l'une modifie une couche utilisée par l'autre
+        return bool(
+            set(self.writes) & (set(other.reads) | set(other.writes))
+            or set(other.writes) & set(self.reads)
+        )
+
+    def run(self, ctx):
+        args = self.args(ctx) if self.args else [ctx[layer] for layer in self.reads]
+        kwargs = {'ctx': ctx} if self.uses_ctx else {}
+        result = self.func(*args, *self.extra, **kwargs)
+        if inspect.iscoroutine(result):
+            result = asyncio.run(result)
+        if len(self.keys) == 1:
+            return {self.keys[0]: result}
+        return dict(zip(self.keys, result))
+
+
+def duplicates_args(file_keys, ctx):
+    return ([(file_key, ctx[layer]) for file_key, layer in file_keys],)
+
+
+def duplicates_rule(choice):
+    suffix = choice.upper()
+    file_keys = [
+        (f"CB_{suffix}", f"CB_{suffix}", ['cl_codeext']),
+        (f"CM_{suffix}", f"CM_{suffix}", ['cm_codeext']),
+        ("PB", "PB", ['pcn_code']),
+        ("ADRESSE", "ADRESSE", ['ad_code']),
+        ("NRO", "NRO", ['nd_code']),
+        ("PA", "PA", ['pcn_code']),
+        ("PEP", f"PEP_{suffix}", ['pcn_code']),
+        ("SRO", "SRO", ['nd_code']),
+        ("SUPPORT", "SUPPORT", ['pt_codeext', 'pcn_id']),
+        ("ZNRO", "ZNRO", ['zn_code']),
+        ("ZPA", "ZPA", ['pcn_code']),
+        ("ZPBO", "ZPBO", ['pcn_code']),
+        ("ZSRO", "ZSRO", ['zs_code']),
+    ]
+    return Rule(
+        "invalid_duplicates", check_duplicates, [layer for _, layer, _ in file_keys],
+        columns={layer: columns for _, layer, columns in file_keys},
+        args=partial(duplicates_args, [(file_key, layer) for file_key, layer, _ in file_keys])
+    )
+
+
+def di_rules():
+    return [
+        Rule("Invalid PBR EL", verify_PBR_EL, ['PB'], columns={'PB': ['pcn_code', 'pcn_pbtyp', 'pcn_ftth']}),
+        Rule("invalid_cb_capafo", verify_cb_capafo, ['CB_DI', 'SUPPORT'], columns={'CB_DI': ['cl_codeext', 'cb_capafo'], 'SUPPORT': ['pcn_newsup']}),
+        duplicates_rule('di'),
+        Rule("invalid_singleEL", singleEL, ['PB'], columns={'PB': ['pcn_code', 'pcn_ftth']}),
+        Rule("invalid_mic_pm", verify_mic_pm, ['ZSRO'], columns={'ZSRO': ['zs_code', 'pcn_umtot']}),
+        Rule("invalid_mic_pa", verify_mic_pa, ['ZPA'], columns={'ZPA': ['pcn_code', 'pcn_umftth']}),
+        Rule("invalid_long_connections", verify_long_connections, ['CM_DI'], columns={'CM_DI': ['cm_codeext', 'cm_long', 'cm_typelog']}),
+        Rule("invalid_length_D1", verify_length_D1, ['CB_DI'], columns={'CB_DI': ['cl_codeext', 'cb_long']}),
+        Rule("invalid_no_overlap", verify_no_overlap, ['PA', 'SUPPORT'], columns={'PA': ['pcn_code'], 'SUPPORT': ['pt_prop']}),
+        Rule("invalid_cb_intersections", verify_c_intersections, ['CB_DI', 'SUPPORT', 'PB', 'PA', 'SRO', 'ADRESSE'], extra=['CB'], columns={'CB_DI': ['cl_codeext']}),
+        Rule("invalid_cm_intersections", verify_c_intersections, ['CM_DI', 'SUPPORT', 'PB', 'PA', 'SRO', 'ADRESSE'], extra=['CM'], columns={'CM_DI': ['cm_codeext']}),
+        Rule("invalid_self_intersections_cb", detect_self_intersections_c, ['CB_DI'], extra=['CB'], columns={'CB_DI': ['cl_codeext']}),
+        Rule("invalid_self_intersections_cm", detect_self_intersections_c, ['CM_DI'], extra=['CM'], columns={'CM_DI': ['cm_codeext']}),
+        Rule(("Not in zones PA", "ND code mismatch PA"), verify_geometries_in_zones, ['PA', 'ZPA'], extra=['PA'], columns={'PA': ['pcn_code'], 'ZPA': ['pcn_code']}),
+        Rule(("Not in zones PB", "ND code mismatch PB"), verify_geometries_in_zones, ['PB', 'ZPBO'], extra=['PB'], columns={'PB': ['pcn_code'], 'ZPBO': ['pcn_code']}),
+        Rule(("Not in zones SRO", "ND code mismatch SRO"), verify_geometries_in_zones, ['SRO', 'ZSRO'], extra=['SRO'], columns={'SRO': ['nd_code'], 'ZSRO': ['zs_code', 'zs_nd_code']}),
+        Rule(("Not in zones NRO", "ND code mismatch NRO"), verify_geometries_in_zones, ['NRO', 'ZNRO'], extra=['NRO'], columns={'NRO': ['nd_code'], 'ZNRO': ['zn_code', 'zn_nd_code']}),
+        Rule("invalid_zpb_in_zonepa", verify_zpb_in_zonepa, ['ZPBO', 'ZPA'], columns={'ZPBO': ['pcn_code', 'pcn_zpa'], 'ZPA': ['pcn_code']}),
+        Rule("invalid_max_distance_between_supports", verify_max_distance_between_supports, ['CM_DI', 'SUPPORT'], columns={'SUPPORT': ['pt_codeext', 'pcn_newsup']}),
+        Rule("invalid_zsro_in_zonenro", verify_zsro_in_zonenro, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_code']}),
+        Rule("invalid_zpa_in_zonesro", verify_zpa_in_zonesro, ['ZPA', 'ZSRO'], columns={'ZPA': ['pcn_code']}),
+        Rule("invalid_zpbo_intersections", check_zp_intersections, ['ZPBO'], extra=['PB'], columns={'ZPBO': ['pcn_code']}),
+        Rule("invalid_zpa_intersections", check_zp_intersections, ['ZPA'], extra=['PA'], columns={'ZPA': ['pcn_code']}),
+        Rule("invalid_cb_without_cm", detect_cb_without_cm, ['CB_DI', 'CM_DI', 'SUPPORT', 'PB', 'PA', 'SRO'], columns={'CB_DI': ['cl_codeext', 'nd_r4_code']}),
+        Rule("incorrect_direction_cables", verify_cable_direction, ['CB_DI', 'NRO', 'SRO', 'PA', 'PB', 'ADRESSE'], columns={'CB_DI': ['cl_codeext']}),
+        # Rule("invalid_pcn_ftth_pb", verify_pcn_ftth_pb, ['PB', 'ZPBO'], columns={'PB': ['pcn_code', 'pcn_ftth'], 'ZPBO': ['pcn_ftth']}),
+        # Rule("invalid_nd_code", verify_nd_code, ['NRO'], extra=['NRO'], columns={'NRO': ['nd_code']}),
+        # Rule("invalid_nd_r3_code", verify_nd_r3_code, ['NRO'], columns={'NRO': ['nd_r3_code']}),
+        # Rule("invalid_zn_code", verify_zn_code, ['ZNRO'], columns={'ZNRO': ['zn_code']}),
+        # Rule("invalid_zn_nd_code", verify_zn_nd_code, ['ZNRO', 'NRO'], columns={'ZNRO': ['zn_nd_code'], 'NRO': ['nd_code']}),
+        # Rule("invalid_zn_r1_code", verify_zn_r1_code, ['ZNRO'], columns={'ZNRO': ['zn_r1_code']}),
+        # Rule("invalid_zn_r2_code", verify_zn_r2_code, ['ZNRO'], columns={'ZNRO': ['zn_r2_code']}),
+        # Rule("invalid_zn_r3_code", verify_zn_r3_code, ['ZNRO', 'NRO'], columns={'ZNRO': ['zn_r3_code'], 'NRO': ['nd_r3_code']}),
+        # Rule("invalid_zn_nroref", verify_zn_nroref, ['ZNRO'], columns={'ZNRO': ['zn_nroref']}),
+        # Rule("invalid_pcn_cb_ent_sro", verify_pcn_cb_ent_sro, ['SRO', 'ADRESSE'], columns={'SRO': ['nd_code', 'pcn_cb_ent'], 'ADRESSE': ['pcn_ftth']}),
+        # Rule("invalid_nd_r4_code", verify_nd_r4_code, ['SRO'], columns={'SRO': ['nd_r4_code']}),
+        # Rule("invalid_zs_code", verify_zs_code, ['ZSRO'], columns={'ZSRO': ['zs_code']}),
+        # Rule("invalid_zs_nd_code", verify_zs_nd_code, ['ZSRO', 'SRO'], columns={'ZSRO': ['zs_nd_code'], 'SRO': ['nd_code']}),
+        # Rule("invalid_zs_zn_code", verify_zs_zn_code, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_zn_code'], 'ZNRO': ['zn_code']}),
+        # Rule("invalid_zs_r1_code", verify_zs_r1_code, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_r1_code'], 'ZNRO': ['zn_r1_code']}),
+        # Rule("invalid_zs_r2_code", verify_zs_r2_code, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_r2_code'], 'ZNRO': ['zn_r2_code']}),
+        # Rule("invalid_zs_r3_code", verify_zs_r3_code, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_r3_code'], 'ZNRO': ['zn_r3_code']}),
+        # Rule("invalid_zs_r4_code", verify_zs_r4_code, ['ZSRO', 'SRO'], columns={'ZSRO': ['zs_r4_code'], 'SRO': ['nd_r4_code']}),
+        # Rule("invalid_zs_refpm", verify_zs_refpm, ['ZSRO'], columns={'ZSRO': ['zs_refpm']}),
+        # Rule("invalid_zs_capamax", verify_zs_capamax, ['ZSRO'], columns={'ZSRO': ['zs_r4_code', 'zs_capamax']}),
+        # Rule("invalid_pcn_ftte_zsro", verify_pcn_ftte_zsro, ['ZSRO', 'ADRESSE'], columns={'ZSRO': ['zs_code', 'pcn_ftte'], 'ADRESSE': ['pcn_ftte']}),
+        # Rule("invalid_pcn_umtot_zsro", verify_pcn_umtot_zsro, ['ZSRO', 'PB'], columns={'ZSRO': ['zs_code', 'pcn_umtot'], 'PB': ['pcn_umftth']}),
+        # Rule("invalid_pcn_code_zpa", verify_pcn_code_zpa, ['ZPA'], columns={'ZPA': ['pcn_code']}),
+        # Rule("invalid_pcn_capa_zpa", verify_pcn_capa_zpa, ['ZPA', 'CB_DI'], columns={'ZPA': ['pcn_code', 'pcn_capa'], 'CB_DI': ['cb_capafo']}),
+        # Rule("invalid_pcn_ftth_zpa", verify_pcn_ftth_zpa, ['ZPA', 'ADRESSE'], columns={'ZPA': ['pcn_code', 'pcn_ftth'], 'ADRESSE': ['pcn_ftth']}),
+        # Rule("invalid_pcn_umftth_zpa", verify_pcn_umftth_zpa, ['ZPA', 'PB'], columns={'ZPA': ['pcn_code', 'pcn_umftth'], 'PB': ['pcn_umftth']}),
+        # Rule("invalid_pcn_ftte_zpa", verify_pcn_ftte_zpa, ['ZPA', 'ADRESSE'], columns={'ZPA': ['pcn_code', 'pcn_ftte'], 'ADRESSE': ['pcn_ftte']}),
+        # Rule("invalid_pcn_umftte_zpa", verify_pcn_umftte_zpa, ['ZPA', 'PB'], columns={'ZPA': ['pcn_code', 'pcn_umftte'], 'PB': ['pcn_umftte']}),
+        # Rule("invalid_pcn_umuti_zpa", verify_pcn_umuti_zpa, ['ZPA'], columns={'ZPA': ['pcn_code', 'pcn_umuti', 'pcn_umftth', 'pcn_umftte']}),
+        # Rule("invalid_pcn_umrsv_zpa", verify_pcn_umrsv_zpa, ['ZPA'], columns={'ZPA': ['pcn_code', 'pcn_umrsv', 'pcn_capa', 'pcn_umuti']}),
+        # Rule("invalid_pcn_umtot_zpa", verify_pcn_umtot_zpa, ['ZPA'], columns={'ZPA': ['pcn_code', 'pcn_umtot', 'pcn_umuti', 'pcn_umrsv']}),
+        # Rule("invalid_pcn_sro_zpa", verify_pcn_sro, ['ZPA', 'ZSRO'], extra=['ZPA'], columns={'ZPA': ['pcn_sro'], 'ZSRO': ['zs_r4_code']}),
+        # Rule("invalid_pcn_sro_pa", verify_pcn_sro, ['PA', 'ZSRO'], extra=['PA'], columns={'PA': ['pcn_sro'], 'ZSRO': ['zs_r4_code']}),
+        Rule("invalid_pcn_code_pa", verify_pcn_code_pa, ['PA', 'ZPA'], columns={'PA': ['pcn_code'], 'ZPA': ['pcn_code']}),
+        Rule("invalid_pcn_cb_ent_pa", verify_pcn_cb_ent_pa, ['PA', 'CB_DI'], columns={'PA': ['pcn_code', 'pcn_cb_ent'], 'CB_DI': ['cb_capafo']}),
+        # Rule("invalid_pcn_code_pb", verify_pcn_code_pb, ['PB'], columns={'PB': ['pcn_code']}),
+        # Rule("invalid_PB_pcn_pbtyp", verify_PB_pcn_pbtyp, ['PB'], columns={'PB': ['pcn_code', 'pcn_pbtyp']}),
+        # Rule("invalid_pcn_ftth", verify_pcn_ftth, ['ZPA', 'PB', 'ZPBO', 'ZSRO', 'ADRESSE'], columns={'ZPA': ['pcn_code', 'pcn_ftth'], 'PB': ['pcn_code', 'pcn_ftth'], 'ZPBO': ['pcn_code', 'pcn_ftth'], 'ZSRO': ['pcn_code', 'pcn_ftth'], 'ADRESSE': ['pcn_ftth']}),
+        # Rule("Invalid_PB_pcn_umftth", verify_PB_pcn_umftth, ['PB'], columns={'PB': ['pcn_code', 'pcn_pbtyp', 'pcn_ftth', 'pcn_umftth']}),
+        # Rule("invalid_pcn_sro_pb", verify_pcn_sro, ['PB', 'ZSRO'], extra=['PB'], columns={'PB': ['pcn_sro'], 'ZSRO': ['zs_r4_code']}),
+        # Rule("invalid_pcn_zpa", verify_pcn_zpa, ['PB', 'ZPA'], columns={'PB': ['pcn_code', 'pcn_zpa'], 'ZPA': ['pcn_code']}),
+        # Rule("invalid_pcn_cb_ent_pb", verify_pcn_cb_ent_pb, ['PB'], columns={'PB': ['pcn_code', 'pcn_pbtyp', 'pcn_ftth', 'pcn_cb_ent']}),
+        # Rule("invalid_pcn_commen_pb", verify_pcn_commen_pb, ['PB'], columns={'PB': ['pcn_code', 'pcn_pbtyp', 'pcn_commen']}),
+        # Rule("invalid_pcn_rac_lg_pb", verify_pcn_rac_lg_pb, ['PB', 'CB_DI'], columns={'PB': ['pcn_code', 'pcn_rac_lg'], 'CB_DI': ['cb_long', 'cb_typelog']}),
+        # Rule("invalid_pcn_code_zpbo", verify_pcn_code_zpbo, ['ZPBO', 'PB'], columns={'ZPBO': ['pcn_code'], 'PB': ['pcn_code']}),
+        # Rule("invalid_zp_r4_code", verify_zp_r4_code, ['ZPBO', 'ZSRO'], columns={'ZPBO': ['zp_r4_code'], 'ZSRO': ['zs_r4_code']}),
+        # Rule("invalid_pcn_zpa_zpbo", verify_pcn_zpa_zpbo, ['ZPBO', 'ZPA'], columns={'ZPBO': ['pcn_code', 'pcn_zpa'], 'ZPA': ['pcn_code']}),
+    ]
+
+
+def tr_rules():
+    return [
+        duplicates_rule('tr'),
+        Rule("invalid_mic_pm", verify_mic_pm, ['ZSRO'], columns={'ZSRO': ['zs_code', 'pcn_umtot']}),
+        # Rule("invalid_length_D1", verify_length_D1, ['CB_TR'], columns={'CB_TR': ['cl_codeext', 'cb_long']}),
+        Rule("invalid_cb_intersections", verify_c_intersections, ['CB_TR', 'SUPPORT', 'PB', 'PA', 'SRO', 'ADRESSE'], extra=['CB'], columns={'CB_TR': ['cl_codeext']}),
+        Rule("invalid_cm_intersections", verify_c_intersections, ['CM_TR', 'SUPPORT', 'PB', 'PA', 'SRO', 'ADRESSE'], extra=['CM'], columns={'CM_TR': ['cm_codeext']}),
+        Rule("invalid_self_intersections_cb", detect_self_intersections_c, ['CB_TR'], extra=['CB'], columns={'CB_TR': ['cl_codeext']}),
+        Rule("invalid_self_intersections_cm", detect_self_intersections_c, ['CM_TR'], extra=['CM'], columns={'CM_TR': ['cm_codeext']}),
+        Rule(("Not in zones SRO", "ND code mismatch SRO"), verify_geometries_in_zones, ['SRO', 'ZSRO'], extra=['SRO'], columns={'SRO': ['nd_code'], 'ZSRO': ['zs_code', 'zs_nd_code']}),
+        Rule(("Not in zones NRO", "ND code mismatch NRO"), verify_geometries_in_zones, ['NRO', 'ZNRO'], extra=['NRO'], columns={'NRO': ['nd_code'], 'ZNRO': ['zn_code', 'zn_nd_code']}),
+        Rule("invalid_zsro_in_zonenro", verify_zsro_in_zonenro, ['ZSRO', 'ZNRO'], columns={'ZSRO': ['zs_code']}),
+        Rule("invalid_zsro_intersections", check_zp_intersections, ['ZSRO'], extra=['SRO'], columns={'ZSRO': ['zs_code']}),
+        Rule("invalid_cb_without_cm", detect_cb_without_cm, ['CB_TR', 'CM_TR', 'SUPPORT', 'PB', 'PA', 'SRO'], columns={'CB_TR': ['cl_codeext', 'nd_r4_code']}),
+        Rule("incorrect_direction_cables", verify_cable_direction, ['CB_TR', 'NRO', 'SRO', 'PA', 'PB', 'ADRESSE'], columns={'CB_TR': ['cl_codeext']}),
+        # Rule("invalid_nd_code", verify_nd_code, ['SRO'], extra=['SRO'], columns={'SRO': ['nd_code']}),
+        # Rule("invalid_pcn_ftte_zsro", verify_pcn_ftte_zsro, ['ZSRO', 'ADRESSE'], columns={'ZSRO': ['zs_code', 'pcn_ftte'], 'ADRESSE': ['pcn_ftte']}),
+        # Rule("invalid_pcn_umtot_zsro", verify_pcn_umtot_zsro, ['ZSRO', 'PB'], columns={'ZSRO': ['zs_code', 'pcn_umtot'], 'PB': ['pcn_umftth']}),
+        # Rule("invalid_pcn_ftth", verify_pcn_ftth, ['ZPA', 'PB', 'ZPBO', 'ZSRO', 'ADRESSE'], columns={'ZPA': ['pcn_code', 'pcn_ftth'], 'PB': ['pcn_code', 'pcn_ftth'], 'ZPBO': ['pcn_code', 'pcn_ftth'], 'ZSRO': ['pcn_code', 'pcn_ftth'], 'ADRESSE': ['pcn_ftth']}),
+    ]
+
+
+def required_columns(rules):
+    # Colonnes attributaires à charger pour chaque couche lue par les règles
+    columns = {}
+    for rule in rules:
+        for layer in rule.reads:
+            names = columns.setdefault(layer, [])
+            names.extend(name for name in rule.columns.get(layer, ()) if name not in names)
+    return columns
+
+
+def rules_for(choice):
+    if choice == 'di':
+        return di_rules()
+    if choice == 'tr':
+        return tr_rules()
+    return None
@@ -0,0 +1,160 @@
+import asyncio
+import contextvars
+import gc
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from ..metrics import RULE_DURATION, clear_gauges, gauge_samples, record_gauges, replay_gauge_samples, size_bucket
+from .anomaly_exports import collect_exports
+from .context import DatasetContext
+from .profiling import profile_rule
+from .shared_layers import SharedLayers, attach_layers
+
+_process_pool = None
+# Côté processus de calcul : livraisons rattachées, les plus récentes d'abord conservées
+_attached = OrderedDict()
+_ATTACHED_MAX = 2
+
+
+def rule_dependencies(rules):
+    # Une règle attend les règles déclarées avant elle avec lesquelles elle est en conflit
+    return [
+        {j for j in range(i) if rule.conflicts(rules[j])}
+        for i, rule in enumerate(rules)
+    ]
+
+
+def process_pool(max_workers):
+    # Pool partagé entre les livraisons ; spawn évite de dupliquer par fork les threads du serveur
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+
+def _close_blocks(blocks):
+    # Ferme les blocs d'une livraison évincée, une fois son contexte et ses couches libérés
+    gc.collect()
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            print(f"Bloc partagé {block.name} encore référencé, fermé à l'arrêt du processus")
+
+
+def _shared_context(token, spec):
+    if token not in _attached:
+        blocks, layers = attach_layers(spec)
+        _attached[token] = (blocks, DatasetContext(layers))
+        while len(_attached) > _ATTACHED_MAX:
+            _close_blocks(_attached.popitem(last=False)[1][0])
+    _attached.move_to_end(token)
+    return _attached[token][1]
+
+
+def run_shared_rule(token, spec, features, rule, profile_dir=None):
+    # Exécutée dans un processus de calcul : les jauges repartent de zéro pour être reportées
+    # telles quelles dans le processus serveur ; la durée d'exécution est renvoyée avec le résultat
+    ctx = _shared_context(token, spec)
+    ctx.features = features
+    clear_gauges()
+    start = time.perf_counter()
+    with collect_exports() as layers, profile_rule(profile_dir, rule.keys[0]):
+        result = rule.run(ctx)
+    return (result, gauge_samples(), layers), time.perf_counter() - start
+
+
+def run_recorded_rule(rule, ctx, profile_dir=None):
+    # Exécutée dans un thread : les écritures de jauges de la règle sont relevées
+    start = time.perf_counter()
+    with record_gauges() as samples, collect_exports() as layers, profile_rule(profile_dir, rule.keys[0]):
+        result = rule.run(ctx)
+    return (result, samples, layers), time.perf_counter() - start
+
+
+async def _schedule(rules, submit):
+    # Lance chaque règle dès que ses dépendances sont terminées ; la première erreur est relevée
+    # une fois les règles en cours terminées
+    dependencies = rule_dependencies(rules)
+    results = [None] * len(rules)
+    done = set()
+    running = {}
+    error = None
+
+    while len(done) < len(rules):
+        if error is None:
+            for i, rule in enumerate(rules):
+                if i in done or i in running.values() or not dependencies[i] <= done:
+                    continue
+                running[submit(rule)] = i
+        if not running:
+            break
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            i = running.pop(task)
+            done.add(i)
+            if task.exception() is not None:
+                print(f"Erreur dans la règle {rules[i].name} : {task.exception()}")
+                error = error or task.exception()
+            else:
+                results[i] = task.result()
+
+    if error is not None:
+        raise error
+    return results
+
+
+async def rule_outcomes(rules, ctx, max_workers, mode='thread', profile_dir=None):
+    # Exécute les règles indépendantes en parallèle ; mode 'thread' (pool de threads, contexte
+    # partagé) ou 'process' (pool de processus rattachés aux couches publiées en mémoire partagée).
+    # Renvoie pour chaque règle (résultat, jauges écrites par la règle, couches d'anomalies) ; les
+    # jauges écrites sont reportées dans le contexte appelant (enregistrement du traitement) dans les
+    # deux modes. Avec profile_dir, le profil de chaque règle y est écrit (voir profiling.py)
+    loop = asyncio.get_running_loop()
+    # Durées observées par règle et par tranche du nombre d'entités des couches lues, mesuré avant
+    # l'exécution (une règle peut modifier une couche)
+    sizes = [size_bucket(sum(len(ctx[layer]) for layer in rule.reads)) for rule in rules]
+
+    if mode == 'process':
+        global _process_pool
+        shared = SharedLayers(ctx.layers)
+        pool = process_pool(max_workers)
+        try:
+            timed_outcomes = await _schedule(
+                rules, lambda rule: loop.run_in_executor(pool, run_shared_rule, shared.token, shared.spec, ctx.features, rule, profile_dir)
+            )
+        except BrokenProcessPool:
+            _process_pool = None
+            raise
+        finally:
+            shared.close()
+    elif mode == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rule') as executor:
+            timed_outcomes = await _schedule(
+                rules, lambda rule: loop.run_in_executor(executor, partial(contextvars.copy_context().run, run_recorded_rule, rule, ctx, profile_dir))
+            )
+    else:
+        raise ValueError(f"Mode d'exécution inconnu : {mode}")
+
+    for (_, samples, _), _ in timed_outcomes:
+        replay_gauge_samples(samples)
+
+    for rule, size, (_, seconds) in zip(rules, sizes, timed_outcomes):
+        RULE_DURATION.labels(rule=rule.keys[0], size=size).observe(seconds)
+    return [outcome for outcome, _ in timed_outcomes]
+
+
+def merge_results(results):
+    # Fusionne les résultats des règles (ou leurs couches d'anomalies) dans l'ordre de déclaration
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return merged
+
+
+async def run_rules(rules, ctx, max_workers, mode='thread'):
+    outcomes = await rule_outcomes(rules, ctx, max_workers, mode)
+    return merge_results(result for result, _, _ in outcomes)
@@ -0,0 +1,134 @@
+import pickle
+import uuid
+from multiprocessing import shared_memory
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Les couches sont publiées une seule fois en mémoire partagée (un bloc par couche) : géométries en WKB
+# (octets concaténés + offsets), attributs en colonnes ; les processus de calcul s'y rattachent sans
+# recevoir les GeoDataFrames par pickle. Les colonnes numériques sont lues directement dans le bloc,
+# les géométries et les textes sont décodés depuis le bloc.
+
+_ALIGN = 8
+
+
+def _variable_length(values):
+    # Valeurs octets (ou None) -> (octets concaténés, offsets, masque des valeurs nulles)
+    is_null = np.array([value is None for value in values], dtype=bool)
+    lengths = np.array([0 if value is None else len(value) for value in values], dtype=np.int64)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(b''.join(value for value in values if value is not None), dtype=np.uint8)
+    return [data, offsets, is_null]
+
+
+def _encode_column(series):
+    values = series.to_numpy()
+    if values.dtype.kind in 'biufmM':
+        return 'numeric', [values]
+    if values.dtype == object:
+        nulls = pd.isna(series).to_numpy()
+        if all(isinstance(value, str) for value in values[~nulls]):
+            encoded = [None if null else value.encode('utf-8') for value, null in zip(values, nulls)]
+            return 'string', _variable_length(encoded)
+    return 'pickle', [np.frombuffer(pickle.dumps(series), dtype=np.uint8)]
+
+
+def _encode_layer(gdf):
+    columns = []
+    for name in gdf.columns:
+        if name == gdf.geometry.name:
+            wkb = shapely.to_wkb(np.asarray(gdf.geometry.values, dtype=object))
+            columns.append((name, 'geometry', _variable_length(list(wkb))))
+        else:
+            columns.append((name, *_encode_column(gdf[name])))
+    if isinstance(gdf.index, pd.RangeIndex):
+        index = ('range', (gdf.index.start, gdf.index.stop, gdf.index.step))
+    else:
+        index = ('pickle', pickle.dumps(gdf.index))
+    return columns, index
+
+
+class SharedLayers:
+    # Publication des couches d'une livraison ; spec est la description (picklable et légère)
+    # transmise aux processus, close() libère les blocs une fois les règles terminées
+
+    def __init__(self, layers):
+        self.token = uuid.uuid4().hex
+        self._blocks = []
+        self.spec = {}
+        for name, gdf in layers.items():
+            columns, index = _encode_layer(gdf)
+            arrays = [array for _, _, column_arrays in columns for array in column_arrays]
+            offsets, size = [], 0
+            for array in arrays:
+                size = -(-size // _ALIGN) * _ALIGN
+                offsets.append(size)
+                size += array.nbytes
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self._blocks.append(block)
+            for array, offset in zip(arrays, offsets):
+                block.buf[offset:offset + array.nbytes] = np.ascontiguousarray(array).view(np.uint8).reshape(-1)
+
+            layout = iter(zip(arrays, offsets))
+            column_specs = []
+            for column_name, kind, column_arrays in columns:
+                column_specs.append((column_name, kind, [
+                    (offset, array.dtype.str, len(array)) for array, offset in
+                    (next(layout) for _ in column_arrays)
+                ]))
+            self.spec[name] = {
+                'block': block.name,
+                'crs': gdf.crs.to_wkt() if gdf.crs is not None else None,
+                'geometry_name': gdf.geometry.name,
+                'index': index,
+                'columns': column_specs,
+            }
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def _view(block, offset, dtype, length):
+    array = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+    array.flags.writeable = False
+    return array
+
+
+def _decode_variable_length(block, buffers):
+    data, offsets, is_null = [_view(block, *buffer) for buffer in buffers]
+    raw = data.tobytes()
+    return [None if null else raw[start:end] for start, end, null in zip(offsets[:-1], offsets[1:], is_null)]
+
+
+def attach_layers(spec):
+    # Reconstruit les GeoDataFrames depuis les blocs partagés ; les blocs sont renvoyés pour
+    # rester ouverts aussi longtemps que les couches sont utilisées
+    blocks, layers = [], {}
+    for name, layer in spec.items():
+        block = shared_memory.SharedMemory(name=layer['block'])
+        blocks.append(block)
+        index_kind, index = layer['index']
+        index = pd.RangeIndex(*index) if index_kind == 'range' else pickle.loads(index)
+        data = {}
+        for column_name, kind, buffers in layer['columns']:
+            if kind == 'geometry':
+                wkb = np.array(_decode_variable_length(block, buffers), dtype=object)
+                data[column_name] = gpd.GeoSeries(shapely.from_wkb(wkb), index=index, crs=layer['crs'])
+            elif kind == 'numeric':
+                data[column_name] = _view(block, *buffers[0])
+            elif kind == 'string':
+                data[column_name] = np.array([
+                    None if value is None else value.decode('utf-8') for value in _decode_variable_length(block, buffers)
+                ], dtype=object)
+            else:
+                data[column_name] = pickle.loads(_view(block, *buffers[0]).tobytes()).to_numpy()
+        layers[name] = gpd.GeoDataFrame(
+            pd.DataFrame(data, index=index, copy=False), geometry=layer['geometry_name'], crs=layer['crs'], copy=False
+        )
+    return blocks, layers
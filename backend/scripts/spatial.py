@@ -0,0 +1,185 @@
+import threading
+import numpy as np
+import shapely
+
+
+def candidate_pairs(gdf, predicate='intersects'):
+    # Paires (i, j), i < j, dont les géométries vérifient le prédicat, triées comme une double boucle
+    if gdf.empty:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty
+    left, right = gdf.sindex.query(gdf.geometry.values, predicate=predicate)
+    keep = left < right
+    left, right = left[keep], right[keep]
+    order = np.lexsort((right, left))
+    return left[order], right[order]
+
+
+def points_hit_layers(points, checks):
+    # Masque des points vérifiant au moins un (couche, prédicat) ; le prédicat s'applique à (point, entité)
+    points = np.asarray(points, dtype=object)
+    hit = np.zeros(len(points), dtype=bool)
+    if not len(points):
+        return hit
+    for gdf, predicate in checks:
+        if gdf.empty:
+            continue
+        idx, _ = gdf.sindex.query(points, predicate=predicate)
+        hit[idx] = True
+    return hit
+
+
+def explode_points(geoms):
+    # Décompose Point / MultiPoint en points simples, avec l'indice de la géométrie d'origine
+    geoms = np.asarray(geoms, dtype=object)
+    type_ids = shapely.get_type_id(geoms)
+    is_point = (type_ids == shapely.GeometryType.POINT) | (type_ids == shapely.GeometryType.MULTIPOINT)
+    kept = np.flatnonzero(is_point)
+    parts, index = shapely.get_parts(geoms[kept], return_index=True)
+    return parts, kept[index]
+
+
+def polygonal_parts(geoms):
+    # Partie surfacique de chaque géométrie (Polygon, MultiPolygon ou membres surfaciques
+    # d'une GeometryCollection), None quand il n'en reste rien
+    geoms = np.asarray(geoms, dtype=object)
+    polygonal = [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON]
+    result = np.full(len(geoms), None, dtype=object)
+
+    members, owner = shapely.get_parts(geoms, return_index=True)
+    keep = np.isin(shapely.get_type_id(members), polygonal)
+    polygons, member_idx = shapely.get_parts(members[keep], return_index=True)
+    owner = owner[keep][member_idx]
+    # Un polygone vide (POLYGON EMPTY) n'est pas une partie surfacique
+    nonempty = ~shapely.is_empty(polygons)
+    polygons, owner = polygons[nonempty], owner[nonempty]
+    if not len(polygons):
+        return result
+
+    owners, group, counts = np.unique(owner, return_inverse=True, return_counts=True)
+    merged = shapely.multipolygons(polygons, indices=group)
+    single = counts == 1
+    merged[single] = polygons[np.searchsorted(group, np.flatnonzero(single))]
+    result[owners] = merged
+    return result
+
+
+def geometry_fingerprints(geoms):
+    # Empreintes (WKB normalisé) identiques pour deux géométries égales à l'ordre des sommets près
+    return shapely.to_wkb(shapely.normalize(np.asarray(geoms, dtype=object)))
+
+
+def uncovered_lines(lines, cover_gdf, cover_fingerprints, node_tree):
+    # Masque des lignes dont une partie n'est couverte ni par cover_gdf ni par un noeud de node_tree
+    # situé sur la ligne ; cover_fingerprints est l'ensemble des empreintes de cover_gdf
+    lines = np.asarray(lines, dtype=object)
+    uncovered = np.zeros(len(lines), dtype=bool)
+    if not len(lines):
+        return uncovered
+    cover_geoms = np.asarray(cover_gdf.geometry.values, dtype=object)
+
+    # Une ligne égale à une géométrie de couverture est couverte
+    todo = np.flatnonzero([fp not in cover_fingerprints for fp in geometry_fingerprints(lines)])
+    if not len(todo):
+        return uncovered
+
+    # Reste non couvert de chaque ligne, calculé contre l'union des seules couvertures voisines
+    line_idx, cover_idx = cover_gdf.sindex.query(lines[todo], predicate='intersects')
+    remainders = lines[todo].copy()
+    for pos, neighbours in zip(*_split_groups(line_idx, cover_idx)):
+        remainders[pos] = shapely.difference(remainders[pos], shapely.union_all(cover_geoms[neighbours]))
+
+    line_idx, node_idx = node_tree.query(lines[todo], predicate='contains')
+    for pos, nodes in zip(*_split_groups(line_idx, node_idx)):
+        remainders[pos] = shapely.difference(remainders[pos], shapely.union_all(node_tree.geometries[nodes]))
+
+    uncovered[todo] = ~shapely.is_empty(remainders)
+    return uncovered
+
+
+def _split_groups(keys, values):
+    # Regroupe values par clé (keys triées par query) : (clés uniques, liste de tableaux)
+    if not len(keys):
+        return [], []
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return unique, np.split(values, starts[1:])
+
+
+def layers_tree(layers):
+    # Index unique sur plusieurs couches, avec le rang de la couche d'origine de chaque entité
+    layer_geoms = [np.asarray(gdf.geometry.values, dtype=object) for gdf in layers]
+    layer_rank = np.repeat(np.arange(len(layers)), [len(geoms) for geoms in layer_geoms])
+    geoms = np.concatenate(layer_geoms) if layer_geoms else np.array([], dtype=object)
+    return shapely.STRtree(geoms), layer_rank
+
+
+def classify_points(points, tree, layer_rank, n_layers):
+    # Rang de la première couche de layers_tree contenant chaque point, -1 si aucune
+    points = np.asarray(points, dtype=object)
+    ranks = np.full(len(points), n_layers, dtype=np.intp)
+    if len(points) and len(layer_rank):
+        point_idx, tree_idx = tree.query(points, predicate='within')
+        np.minimum.at(ranks, point_idx, layer_rank[tree_idx])
+    ranks[ranks == n_layers] = -1
+    return ranks
+
+
+def line_endpoints(lines_gdf):
+    # Extrémités (bord) de chaque ligne, avec l'indice de la ligne d'origine
+    return explode_points(shapely.boundary(np.asarray(lines_gdf.geometry.values, dtype=object)))
+
+
+def endpoint_zone_pairs(endpoints, zones_gdf):
+    # Paires uniques (zone, ligne) telles que la zone contient une extrémité de la ligne
+    points, line_idx = endpoints
+    if not len(points) or zones_gdf.empty:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty
+    point_idx, zone_idx = zones_gdf.sindex.query(points, predicate='within')
+    pairs = np.unique(np.column_stack([zone_idx, line_idx[point_idx]]), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def max_per_zone(zones_gdf, lines_gdf, column, endpoints):
+    # Maximum de column parmi les lignes dont une extrémité tombe dans la zone, indexé par la
+    # position de la zone ; les zones sans ligne sont absentes
+    zone_idx, line_idx = endpoint_zone_pairs(endpoints, zones_gdf)
+    return lines_gdf[column].iloc[line_idx].groupby(zone_idx).max()
+
+
+class ZoneAggregates:
+    # Affectation des points aux zones (point strictement à l'intérieur) calculée une seule fois
+    # par couple de couches, et sommes par zone mises en cache par colonne
+
+    def __init__(self):
+        self._assignments = {}
+        self._sums = {}
+        self._lock = threading.RLock()
+
+    def assignment(self, zones_gdf, points_gdf):
+        with self._lock:
+            return self._assignment(zones_gdf, points_gdf)
+
+    def _assignment(self, zones_gdf, points_gdf):
+        key = (id(zones_gdf), id(points_gdf))
+        if key not in self._assignments:
+            if zones_gdf.empty or points_gdf.empty:
+                empty = np.array([], dtype=np.intp)
+                point_idx, zone_idx = empty, empty
+            else:
+                point_idx, zone_idx = zones_gdf.sindex.query(points_gdf.geometry.values, predicate='within')
+            # Les couches sont conservées pour que leur id ne soit pas réattribué tant que le cache vit
+            self._assignments[key] = (zones_gdf, points_gdf, zone_idx, point_idx)
+        return self._assignments[key][2:]
+
+    def sums(self, zones_gdf, points_gdf, column):
+        # Somme de column sur les points contenus dans chaque zone, dans l'ordre des zones (0 si vide)
+        key = (id(zones_gdf), id(points_gdf), column)
+        with self._lock:
+            if key not in self._sums:
+                zone_idx, point_idx = self._assignment(zones_gdf, points_gdf)
+                values = points_gdf[column].iloc[point_idx].groupby(zone_idx).sum()
+                self._sums[key] = values.reindex(range(len(zones_gdf)), fill_value=0).tolist()
+            return self._sums[key]
@@ -1,86 +1,83 @@
 from shapely import wkt
-from shapely.geometry import Point, LineString, MultiPoint, MultiPolygon, GeometryCollection, Polygon
-from shapely.ops import unary_union
+from shapely.geometry import LineString, MultiPolygon, Polygon
 import pandas as pd
-import re, os
+import re
+import numpy as np
+import shapely
 import geopandas as gpd
-from datetime import datetime
 from ..metrics import *
+from .anomaly_exports import export_layer
+from .context import DatasetContext
+from .incremental import context_fingerprint, match_rows, pairs_order, row_fingerprints, split_pairs
+from .spatial import candidate_pairs, classify_points, explode_points, points_hit_layers, polygonal_parts, uncovered_lines
 
-def convert_geometries_to_wkt(gdf):
-    gdf['wkt'] = gdf['geometry'].apply(lambda geom: wkt.dumps(geom))
-    return gdf
-
-async def verify_geometries_in_zones(gdf, zgdf, zone_type):
-    if gdf.crs != zgdf.crs:
-        gdf = gdf.to_crs(zgdf.crs)
-
-    gdf = convert_geometries_to_wkt(gdf)
-    zgdf = convert_geometries_to_wkt(zgdf)
+async def verify_geometries_in_zones(gdf, zgdf, zone_type, ctx=None):
+    ctx = ctx or DatasetContext()
+    gdf = ctx.to_crs(gdf, zgdf.crs)
 
     if zone_type in ['PA', 'PB']:
-        z_dict = {row['pcn_code']: wkt.loads(row['wkt']) for _, row in zgdf.iterrows()}
+        zone_code, zone_nd_code, feature_key = 'pcn_code', None, 'pcn_code'
     elif zone_type == 'SRO':
-        z_dict = {row['zs_code']: (wkt.loads(row['wkt']), row['zs_nd_code']) for _, row in zgdf.iterrows()}
+        zone_code, zone_nd_code, feature_key = 'zs_code', 'zs_nd_code', 'nd_code'
     elif zone_type == 'NRO':
-        z_dict = {row['zn_code']: (wkt.loads(row['wkt']), row['zn_nd_code']) for _, row in zgdf.iterrows()}
+        zone_code, zone_nd_code, feature_key = 'zn_code', 'zn_nd_code', 'nd_code'
     else:
         raise ValueError("Le paramètre 'zone_type' doit être 'PA', 'PB', 'SRO' ou 'NRO'.")
 
-    not_in_zones = []
-    nd_code_mismatch = []
-    rows_outside_zone = []
-    rows_nd_code_mismatch = []
-
-    for _, row in gdf.iterrows():
-        geom = wkt.loads(row['wkt'])
-        if zone_type in ['PA', 'PB']:
-            z_geom = z_dict.get(row['pcn_code'])
-            if not z_geom or not z_geom.contains(geom):
-                not_in_zones.append(row['pcn_code'])
-                rows_outside_zone.append(row)
-        else:
-            nd_code = row['nd_code']
-            z_data = next(((zg, zc) for zc, (zg, znd) in z_dict.items() if znd == nd_code), None)
-
-            if not z_data:
-                not_in_zones.append(nd_code)
-                rows_outside_zone.append(row)
-                continue
-
-            z_geom, z_code = z_data
-
-            if not z_geom.contains(geom):
-                not_in_zones.append(nd_code)
-                rows_outside_zone.append(row)
-            elif nd_code != z_dict[z_code][1]:
-                nd_code_mismatch.append(nd_code)
-                rows_nd_code_mismatch.append(row)
-
-    if rows_outside_zone:
-        export_outside_gdf = gpd.GeoDataFrame(rows_outside_zone, crs=gdf.crs)
-        export_outside_gdf["geometry"] = export_outside_gdf["wkt"].apply(wkt.loads)
-
-        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-        os.makedirs(downloads, exist_ok=True)
-
-        shp_out_path = os.path.join(downloads, f"{zone_type.lower()}_outside_zone.shp")
-        gpkg_out_path = os.path.join(downloads, f"{zone_type.lower()}_outside_zone.gpkg")
-
-        export_outside_gdf.to_file(shp_out_path, driver='ESRI Shapefile', encoding='UTF-8')
-        export_outside_gdf.to_file(gpkg_out_path, layer=f"{zone_type.lower()}_outside_zone", driver='GPKG')
-        print(f"Entités hors zones exportées :\n- SHP: {shp_out_path}\n- GPKG: {gpkg_out_path}")
-
-    if rows_nd_code_mismatch:
-        export_mismatch_gdf = gpd.GeoDataFrame(rows_nd_code_mismatch, crs=gdf.crs)
-        export_mismatch_gdf["geometry"] = export_mismatch_gdf["wkt"].apply(wkt.loads)
-
-        shp_mis_path = os.path.join(downloads, f"{zone_type.lower()}_nd_code_mismatch.shp")
-        gpkg_mis_path = os.path.join(downloads, f"{zone_type.lower()}_nd_code_mismatch.gpkg")
+    zones = ctx.zones_by_code(zgdf, zone_code)
+    if zone_nd_code:
+        zones = ctx.memo(
+            ('zones_by_nd_code', zone_code, zone_nd_code),
+            lambda: zones.drop_duplicates(zone_nd_code, keep='first').set_index(zone_nd_code, drop=False),
+            zgdf
+        )
 
-        export_mismatch_gdf.to_file(shp_mis_path, driver='ESRI Shapefile', encoding='UTF-8')
-        export_mismatch_gdf.to_file(gpkg_mis_path, layer=f"{zone_type.lower()}_nd_code_mismatch", driver='GPKG')
-        print(f"Entités avec nd_code incorrect exportées :\n- SHP: {shp_mis_path}\n- GPKG: {gpkg_mis_path}")
+    feature_keys = gdf[feature_key]
+    inside = np.zeros(len(gdf), dtype=bool)
+    mismatch = np.zeros(len(gdf), dtype=bool)
+    todo = np.ones(len(gdf), dtype=bool)
+
+    # Entités inchangées depuis la livraison de référence, avec les mêmes zones : résultat repris.
+    # Sans reprise des calculs (ctx.features None), aucune empreinte n'est calculée
+    state_name = f"geometries_in_zones_{zone_type}"
+    previous = None
+    if ctx.features is not None:
+        fingerprints = row_fingerprints(gdf, [feature_key])
+        context = context_fingerprint(zgdf.crs, (zgdf, [zone_code, zone_nd_code]))
+        previous = ctx.feature_state(state_name, context)
+    if previous is not None:
+        position = match_rows(fingerprints, previous['fingerprints'])
+        reused = position >= 0
+        inside[reused] = previous['inside'][position[reused]]
+        mismatch[reused] = previous['mismatch'][position[reused]]
+        todo = ~reused
+
+    zone_pos = zones.index.get_indexer(feature_keys)
+    matched = (zone_pos >= 0) & todo
+
+    zone_geoms = ctx.geometries(zones)
+    inside[matched] = shapely.contains(
+        zone_geoms[zone_pos[matched]], np.asarray(gdf.geometry.values, dtype=object)[matched]
+    )
+
+    if zone_nd_code:
+        checked = inside & todo
+        nd_codes = feature_keys[checked]
+        z_nd_codes = zones[zone_nd_code].iloc[zone_pos[checked]].set_axis(nd_codes.index)
+        mismatch[checked] = (nd_codes != z_nd_codes) & nd_codes.notna()
+    if ctx.features is not None:
+        ctx.save_feature_state(state_name, context, {'fingerprints': fingerprints, 'inside': inside, 'mismatch': mismatch})
+
+    rows_outside_zone = gdf[~inside]
+    rows_nd_code_mismatch = gdf[mismatch]
+    not_in_zones = rows_outside_zone[feature_key].tolist()
+    nd_code_mismatch = rows_nd_code_mismatch[feature_key].tolist()
+
+    if not rows_outside_zone.empty:
+        export_layer(f"{zone_type.lower()}_outside_zone", rows_outside_zone)
+
+    if not rows_nd_code_mismatch.empty:
+        export_layer(f"{zone_type.lower()}_nd_code_mismatch", rows_nd_code_mismatch)
 
     if not_in_zones:
         ANOMALY_COUNT.inc(len(not_in_zones))
@@ -93,64 +90,66 @@ async def verify_geometries_in_zones(gdf, zgdf, zone_type):
 
     return not_in_zones, nd_code_mismatch
 
-async def check_zp_intersections(zp_gdf, x):
+async def check_zp_intersections(zp_gdf, x, ctx=None):
 
     if zp_gdf.crs is None:
         raise ValueError(f"Le GeoDataFrame des Z{x} doit avoir un CRS défini.")
     crs = zp_gdf.crs
-
-    records = []
-    for i, row1 in zp_gdf.iterrows():
-        for j, row2 in zp_gdf.iloc[i+1:].iterrows():
-            raw = row1.geometry.intersection(row2.geometry)
-            if raw.is_empty:
-                continue
-            geoms = []
-            if isinstance(raw, (Polygon, MultiPolygon)):
-                geoms = [raw] if isinstance(raw, Polygon) else list(raw.geoms)
-            elif isinstance(raw, GeometryCollection):
-                for geom in raw.geoms:
-                    if isinstance(geom, (Polygon, MultiPolygon)):
-                        geoms.extend([geom] if isinstance(geom, Polygon) else list(geom.geoms))
-            if not geoms:
-                continue
-            inter_geom = geoms[0] if len(geoms) == 1 else MultiPolygon(geoms)
-
-            code1 = row1['zs_code'] if x == 'SRO' else row1['pcn_code']
-            code2 = row2['zs_code'] if x == 'SRO' else row2['pcn_code']
-            records.append({
-                'code1': code1,
-                'code2': code2,
-                'wkt': inter_geom.wkt
-            })
+    ctx = ctx or DatasetContext()
+    code_attr = 'zs_code' if x == 'SRO' else 'pcn_code'
+
+    # Seules les paires comportant une zone nouvelle ou modifiée depuis la livraison de référence sont calculées
+    state_name = f"zp_intersections_{x}"
+    previous = None
+    if ctx.features is not None:
+        fingerprints = row_fingerprints(zp_gdf, [code_attr])
+        context = context_fingerprint(crs)
+        previous = ctx.feature_state(state_name, context)
+    if previous is None:
+        left, right = candidate_pairs(zp_gdf)
+    else:
+        left, right, reused, reused_left, reused_right = split_pairs(zp_gdf, fingerprints, previous)
+
+    geoms = zp_gdf.geometry.values
+    overlaps = polygonal_parts(shapely.intersection(geoms[left], geoms[right]))
+    found = np.flatnonzero(~shapely.is_missing(overlaps))
+    left, right, overlaps = left[found], right[found], overlaps[found]
+
+    if previous is not None:
+        left, right = np.concatenate([left, reused_left]), np.concatenate([right, reused_right])
+        overlaps = np.concatenate([overlaps, previous['overlaps'][reused]])
+        order = pairs_order(left, right)
+        left, right, overlaps = left[order], right[order], overlaps[order]
+    if ctx.features is not None:
+        ctx.save_feature_state(state_name, context, {'fingerprints': fingerprints, 'left': left, 'right': right, 'overlaps': overlaps})
+
+    codes = zp_gdf[code_attr].to_numpy()
+    records = [
+        {'code1': code1, 'code2': code2, 'wkt': inter_wkt}
+        for code1, code2, inter_wkt in zip(
+            codes[left].tolist(), codes[right].tolist(), shapely.to_wkt(overlaps, rounding_precision=-1)
+        )
+    ]
 
     if not records:
         print(f"Aucune zone d'intersection détectée pour Z{x}.")
         return []
 
-    inter_gdf = gpd.GeoDataFrame([
-        {'code1': r['code1'], 'code2': r['code2'], 'geometry': wkt.loads(r['wkt'])} for r in records
-    ], crs=crs)
-
-    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    os.makedirs(downloads, exist_ok=True)
-    shp_path = os.path.join(downloads, f"zp_{x.lower()}_intersect.shp")
-    gpkg_path = os.path.join(downloads, f"zp_{x.lower()}_intersect.gpkg")
-
-    inter_gdf.to_file(shp_path, driver='ESRI Shapefile', encoding='UTF-8', engine='fiona')
-    inter_gdf.to_file(gpkg_path, layer=f"zp_{x.lower()}_intersect", driver='GPKG')
+    inter_gdf = gpd.GeoDataFrame(
+        {'code1': [r['code1'] for r in records], 'code2': [r['code2'] for r in records]},
+        geometry=overlaps, crs=crs
+    )
 
-    print(f"Couches d'intersection Z{x} exportées :\n- SHP: {shp_path}\n- GPKG: {gpkg_path}")
+    export_layer(f"zp_{x.lower()}_intersect", inter_gdf)
     ANOMALY_COUNT.inc(len(records))
 
     return records
 
-async def verify_zsro_in_zonenro(zsro_gdf, znro_gdf):
-   
-    if zsro_gdf.crs != znro_gdf.crs:
-        zsro_gdf = zsro_gdf.to_crs(znro_gdf.crs)
+async def verify_zsro_in_zonenro(zsro_gdf, znro_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    zsro_gdf = ctx.to_crs(zsro_gdf, znro_gdf.crs)
 
-    znro_geom = znro_gdf.unary_union
+    znro_geom = ctx.union(znro_gdf)
     records = []
     for idx, row in zsro_gdf.iterrows():
         diff = row.geometry.difference(znro_geom)
@@ -174,10 +173,7 @@ async def verify_zsro_in_zonenro(zsro_gdf, znro_gdf):
     export_gdf = gpd.GeoDataFrame([
         {'zs_code': r['zs_code'], 'geometry': wkt.loads(r['wkt'])} for r in records
     ], crs=zsro_gdf.crs)
-    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    os.makedirs(downloads, exist_ok=True)
-    export_gdf.to_file(os.path.join(downloads, "zsro_not_in_znro.shp"), driver='ESRI Shapefile', encoding='UTF-8', engine='fiona')
-    export_gdf.to_file(os.path.join(downloads, "zsro_not_in_znro.gpkg"), layer="zsro_not_in_znro", driver='GPKG')
+    export_layer("zsro_not_in_znro", export_gdf)
     ANOMALY_COUNT.inc(len(records))
     return records
 
@@ -187,18 +183,18 @@ async def detect_self_intersections_c(c_gdf, type):
 
     code_attr = 'cm_codeext' if type == 'CM' else 'cl_codeext'
 
-    if code_attr in c_gdf.columns:
-        c_gdf[code_attr] = c_gdf[code_attr].astype(str)
+    # Codes convertis en texte sur une copie : la couche est partagée avec les autres règles
+    codes = c_gdf[code_attr].astype(str)
 
     self_int_codes = []
     rows_to_export = []
 
-    for idx, row in c_gdf.iterrows():
+    for (idx, row), code in zip(c_gdf.iterrows(), codes):
         geom = row.geometry
-        code = row[code_attr]
         if isinstance(geom, LineString):
             if not geom.is_valid or not geom.is_simple:
                 self_int_codes.append(code)
+                row[code_attr] = code
                 rows_to_export.append(row)
                 status = "invalide" if not geom.is_valid else "auto-intersectante"
                 print(f"{type} {code} a une géométrie {status}.")
@@ -211,30 +207,20 @@ async def detect_self_intersections_c(c_gdf, type):
         for code in self_int_codes:
             print(f"- {code}")
 
-        
-        export_gdf = gpd.GeoDataFrame(rows_to_export, crs=c_gdf.crs)
-
-        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-        os.makedirs(downloads, exist_ok=True)
-
-        shp_path = os.path.join(downloads, f"{type.lower()}_self_intersections.shp")
-        gpkg_path = os.path.join(downloads, f"{type.lower()}_self_intersections.gpkg")
 
-        export_gdf.to_file(shp_path, driver='ESRI Shapefile', encoding='UTF-8')
-        print(f"Shapefile exporté dans : {shp_path}")
-
-        export_gdf.to_file(gpkg_path, layer=f"{type.lower()}_self_intersections", driver='GPKG')
-        print(f"GeoPackage exporté dans : {gpkg_path}")
+        export_gdf = gpd.GeoDataFrame(rows_to_export, crs=c_gdf.crs)
+        export_layer(f"{type.lower()}_self_intersections", export_gdf)
 
     return self_int_codes
 
-async def verify_c_intersections(c_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf, type_):
+async def verify_c_intersections(c_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf, type_, ctx=None):
     if c_di_gdf.crs is None:
         raise ValueError("Le GeoDataFrame des CB doit avoir un système de coordonnées (CRS) défini.")
 
-    for gdf in [support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf]:
-        if gdf.crs != c_di_gdf.crs:
-            gdf.to_crs(c_di_gdf.crs, inplace=True)
+    ctx = ctx or DatasetContext()
+    support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf = [
+        ctx.to_crs(gdf, c_di_gdf.crs) for gdf in [support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf]
+    ]
 
     if type_ == 'CB':
         code_attr = 'cl_codeext'
@@ -243,60 +229,58 @@ async def verify_c_intersections(c_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf,
     else:
         raise ValueError(f"Type inconnu: {type_}. Les types valides sont 'CB' et 'CM'.")
 
-    export_records = []
-    code_pairs = []
-
-    for i, row1 in c_di_gdf.iterrows():
-        for j, row2 in c_di_gdf.iloc[i+1:].iterrows():
-            if row1.geometry.intersects(row2.geometry) and not row1.geometry.touches(row2.geometry):
-                raw = row1.geometry.intersection(row2.geometry)
-                pts = []
-                if isinstance(raw, MultiPoint):
-                    pts = list(raw.geoms)
-                elif isinstance(raw, Point):
-                    pts = [raw]
-                else:
-                    continue
-
-                for pt in pts:
-                    if not (
-                        pb_gdf.geometry.touches(pt).any() or
-                        pa_gdf.geometry.touches(pt).any() or
-                        sro_gdf.geometry.touches(pt).any() or
-                        adresse_gdf.geometry.touches(pt).any() or
-                        support_gdf.geometry.contains(pt).any() or support_gdf.geometry.touches(pt).any()
-                    ):
-                        val1 = row1[code_attr]
-                        val2 = row2[code_attr]
-                        export_records.append({
-                            'code1': val1,
-                            'code2': val2,
-                            'geometry': pt
-                        })
-                        code_pairs.append((val1, val2))
+    # Seules les paires comportant un câble nouveau ou modifié depuis la livraison de référence sont
+    # calculées, tant que les noeuds sont inchangés
+    state_name = f"c_intersections_{type_}"
+    previous = None
+    if ctx.features is not None:
+        fingerprints = row_fingerprints(c_di_gdf, [code_attr])
+        context = context_fingerprint(
+            c_di_gdf.crs, *[(gdf, []) for gdf in [support_gdf, pb_gdf, pa_gdf, sro_gdf, adresse_gdf]]
+        )
+        previous = ctx.feature_state(state_name, context)
+    if previous is None:
+        left, right = candidate_pairs(c_di_gdf)
+    else:
+        left, right, reused, reused_left, reused_right = split_pairs(c_di_gdf, fingerprints, previous)
+
+    geoms = c_di_gdf.geometry.values
+    crossing = ~shapely.touches(geoms[left], geoms[right])
+    left, right = left[crossing], right[crossing]
+
+    points, pair_idx = explode_points(shapely.intersection(geoms[left], geoms[right]))
+    on_node = points_hit_layers(points, [
+        (pb_gdf, 'touches'),
+        (pa_gdf, 'touches'),
+        (sro_gdf, 'touches'),
+        (adresse_gdf, 'touches'),
+        (support_gdf, 'within'),
+        (support_gdf, 'touches'),
+    ])
+    points, pair_idx = points[~on_node], pair_idx[~on_node]
+    point_left, point_right = left[pair_idx], right[pair_idx]
+
+    if previous is not None:
+        point_left = np.concatenate([point_left, reused_left])
+        point_right = np.concatenate([point_right, reused_right])
+        points = np.concatenate([points, previous['points'][reused]])
+        order = pairs_order(point_left, point_right)
+        point_left, point_right, points = point_left[order], point_right[order], points[order]
+    if ctx.features is not None:
+        ctx.save_feature_state(state_name, context, {'fingerprints': fingerprints, 'left': point_left, 'right': point_right, 'points': points})
+
+    codes = c_di_gdf[code_attr].to_numpy()
+    code1 = codes[point_left].tolist()
+    code2 = codes[point_right].tolist()
+    export_records = [
+        {'code1': val1, 'code2': val2, 'geometry': pt}
+        for val1, val2, pt in zip(code1, code2, points)
+    ]
+    code_pairs = list(zip(code1, code2))
 
     if export_records:
         inter_gdf = gpd.GeoDataFrame(export_records, crs=c_di_gdf.crs)
-
-        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-        os.makedirs(downloads, exist_ok=True)
-
-        shp_path = os.path.join(downloads, f"{type_.lower()}_intersections.shp")
-        gpkg_path = os.path.join(downloads, f"{type_.lower()}_intersections.gpkg")
-
-        inter_gdf[['code1', 'code2', 'geometry']].to_file(
-            shp_path,
-            driver='ESRI Shapefile',
-            encoding='UTF-8',
-            engine='fiona'
-        )
-        inter_gdf.to_file(
-            gpkg_path,
-            layer=f"{type_.lower()}_intersections",
-            driver='GPKG'
-        )
-
-        print(f"Couche d'intersections exportée :\n- SHP: {shp_path}\n- GPKG: {gpkg_path}")
+        export_layer(f"{type_.lower()}_intersections", inter_gdf)
     else:
         print(f"Aucune intersection isolée détectée pour le type {type_}.")
 
@@ -320,39 +304,15 @@ async def verify_mic_pm(zsro_gdf):
     
     return invalid_pms
 
-async def detect_cb_without_cm(cb_di_gdf, cm_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf):
-    gdfs = [cm_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf]
-    for gdf in gdfs:
-        if cb_di_gdf.crs != gdf.crs:
-            gdf = gdf.to_crs(cb_di_gdf.crs)
-
-    cb_sans_cm = []
-
-    for idx_cb, cb_row in cb_di_gdf.iterrows():
-        cb_geom = cb_row.geometry
-
-        match_found = any(cb_geom.equals(cm_geom) for cm_geom in cm_di_gdf.geometry)
-
-        if not match_found:
-            cm_union = unary_union(cm_di_gdf.geometry)
-            cb_diff_cm = cb_geom.difference(cm_union)
-
-            supports_in_cb = support_gdf[support_gdf.geometry.within(cb_geom)]
-            pbs_in_cb = pb_gdf[pb_gdf.geometry.within(cb_geom)]
-            pas_in_cb = pa_gdf[pa_gdf.geometry.within(cb_geom)]
-            sros_in_cb = sro_gdf[sro_gdf.geometry.within(cb_geom)]
-
-            all_elements_geom = unary_union(
-                list(supports_in_cb.geometry) + 
-                list(pbs_in_cb.geometry) + 
-                list(pas_in_cb.geometry) + 
-                list(sros_in_cb.geometry)
-            )
-
-            uncovered_area = cb_diff_cm.difference(all_elements_geom)
+async def detect_cb_without_cm(cb_di_gdf, cm_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    cm_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf = [
+        ctx.to_crs(gdf, cb_di_gdf.crs) for gdf in [cm_di_gdf, support_gdf, pb_gdf, pa_gdf, sro_gdf]
+    ]
 
-            if not uncovered_area.is_empty:
-                cb_sans_cm.append(cb_row['cl_codeext'])
+    node_tree, _ = ctx.layers_tree(support_gdf, pb_gdf, pa_gdf, sro_gdf)
+    uncovered = uncovered_lines(cb_di_gdf.geometry.values, cm_di_gdf, ctx.fingerprints(cm_di_gdf), node_tree)
+    cb_sans_cm = cb_di_gdf.loc[uncovered, 'cl_codeext'].tolist()
 
     if cb_sans_cm:
         cb_sans_cm_gdf = cb_di_gdf[cb_di_gdf['cl_codeext'].isin(cb_sans_cm)].copy()
@@ -362,18 +322,8 @@ async def detect_cb_without_cm(cb_di_gdf, cm_di_gdf, support_gdf, pb_gdf, pa_gdf
             print(f"- {cb}")
         for _, row in cb_sans_cm_gdf[['cl_codeext','nd_r4_code']].iterrows():
             print(f"Exporter : cl_codeext={row['cl_codeext']} — nd_r4_code={row['nd_r4_code']}")
-        
-        downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        shp = os.path.join(downloads, f"cb_sans_cm_{timestamp}.shp")
-        
-        try:
-            cb_sans_cm_gdf.to_file(shp, driver='ESRI Shapefile', encoding='UTF-8')
-            print(f"Shapefile exporté dans {shp}")
-        except PermissionError as e:
-            print(f"Erreur de permission lors de l'écriture du fichier : {e}")
-        
+        export_layer("cb_sans_cm", cb_sans_cm_gdf)
+
     return cb_sans_cm
 
 async def check_column_duplicates(data, column_name, file_key):
@@ -420,51 +370,31 @@ async def check_duplicates(dataframes):
     except Exception as e:
         print(f"Erreur lors de la vérification des doublons : {e}")
 
-async def verify_cable_direction(cb_di_gdf, nro_gdf, sro_gdf, pa_gdf, pb_gdf, adresse_gdf):
-    def get_zone_type(geom, zone_gdfs):
-        for zone_type, zone_gdf in zone_gdfs.items():
-            if zone_gdf.geometry.contains(geom).any():
-                return zone_type
-        return None
-
-    zone_gdfs = {
-        'NRO': nro_gdf,
-        'SRO': sro_gdf,
-        'PA': pa_gdf,
-        'PB': pb_gdf,
-        'ADRESSE': adresse_gdf
-    }
+CABLE_ZONE_TYPES = ['NRO', 'SRO', 'PA', 'PB', 'ADRESSE']
+# Transitions autorisées origine -> extrémité : même type, ou NRO -> SRO -> PA -> PB -> ADRESSE
+ALLOWED_CABLE_DIRECTIONS = np.eye(len(CABLE_ZONE_TYPES), dtype=bool) | np.eye(len(CABLE_ZONE_TYPES), k=1, dtype=bool)
 
-    incorrect_cables = []
+async def verify_cable_direction(cb_di_gdf, nro_gdf, sro_gdf, pa_gdf, pb_gdf, adresse_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    zone_tree, zone_rank = ctx.layers_tree(nro_gdf, sro_gdf, pa_gdf, pb_gdf, adresse_gdf)
+    n_types = len(CABLE_ZONE_TYPES)
 
-    for _, row in cb_di_gdf.iterrows():
-        geom = row['geometry']
-        if not isinstance(geom, LineString):
-            continue
+    geoms = np.asarray(cb_di_gdf.geometry.values, dtype=object)
+    lines = np.flatnonzero(shapely.get_type_id(geoms) == shapely.GeometryType.LINESTRING)
+    source_type = classify_points(shapely.get_point(geoms[lines], 0), zone_tree, zone_rank, n_types)
+    destination_type = classify_points(shapely.get_point(geoms[lines], -1), zone_tree, zone_rank, n_types)
 
-        source = Point(geom.coords[0])
-        destination = Point(geom.coords[-1])
-
-        source_zone_type = get_zone_type(source, zone_gdfs)
-        destination_zone_type = get_zone_type(destination, zone_gdfs)
-
-        if source_zone_type and destination_zone_type:
-            if source_zone_type == destination_zone_type:
-                continue
-            elif source_zone_type == 'NRO' and destination_zone_type == 'SRO':
-                continue
-            elif source_zone_type == 'SRO' and destination_zone_type == 'PA':
-                continue
-            elif source_zone_type == 'PA' and destination_zone_type == 'PB':
-                continue
-            elif source_zone_type == 'PB' and destination_zone_type == 'ADRESSE':
-                continue
-
-        incorrect_cables.append({
-            'cl_codeext': row['cl_codeext'],
-            'geometry': geom 
-        })
-        ZPA_NOT_IN_ZSRO.labels(zone_type='CABLE', code=row['cl_codeext']).set(1)
+    classified = (source_type >= 0) & (destination_type >= 0)
+    allowed = np.zeros(len(lines), dtype=bool)
+    allowed[classified] = ALLOWED_CABLE_DIRECTIONS[source_type[classified], destination_type[classified]]
+    incorrect = lines[~allowed]
+
+    incorrect_cables = [
+        {'cl_codeext': code, 'geometry': geom}
+        for code, geom in zip(cb_di_gdf['cl_codeext'].to_numpy()[incorrect].tolist(), geoms[incorrect])
+    ]
+    for cable in incorrect_cables:
+        ZPA_NOT_IN_ZSRO.labels(zone_type='CABLE', code=cable['cl_codeext']).set(1)
 
     if not incorrect_cables:
         print("Tous les câbles ont un sens correct.")
@@ -479,12 +409,7 @@ async def verify_cable_direction(cb_di_gdf, nro_gdf, sro_gdf, pa_gdf, pb_gdf, ad
     ]
 
     incorrect_gdf = gpd.GeoDataFrame(incorrect_cables, crs=cb_di_gdf.crs)
-
-    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    os.makedirs(downloads, exist_ok=True)
-
-    incorrect_gdf.to_file(os.path.join(downloads, "cables_incorrect_direction.shp"), driver='ESRI Shapefile', encoding='UTF-8', engine='fiona')
-    incorrect_gdf.to_file(os.path.join(downloads, "cables_incorrect_direction.gpkg"), layer="cables_incorrect_direction", driver='GPKG')
+    export_layer("cables_incorrect_direction", incorrect_gdf)
 
     ANOMALY_COUNT.inc(len(incorrect_cables))
     print("Les câbles suivants ont un sens incorrect :")
@@ -773,7 +698,9 @@ async def verify_zs_capamax(zsro_gdf):
     
     return invalid_zs_capamax
 
-async def verify_pcn_ftth(zpa_gdf, pb_gdf, zpbo_gdf, zsro_gdf, adresse_gdf):
+async def verify_pcn_ftth(zpa_gdf, pb_gdf, zpbo_gdf, zsro_gdf, adresse_gdf, ctx=None):
+    aggregates = (ctx or DatasetContext()).aggregates
+
     async def check_table(gdf, table_name):
         missing_pcn_ftth = gdf['pcn_ftth'].isna() | (gdf['pcn_ftth'] == '')
         
@@ -782,13 +709,10 @@ async def verify_pcn_ftth(zpa_gdf, pb_gdf, zpbo_gdf, zsro_gdf, adresse_gdf):
             return False
         
         invalid_pcn_ftth = []
-        for i, row in gdf.iterrows():
-            geometry = row['geometry']
+        aggregate_sums = aggregates.sums(gdf, adresse_gdf, 'pcn_ftth')
+        for row, aggregate_pcn_ftth in zip(gdf.to_dict('records'), aggregate_sums):
             za_pcn_ftth = row['pcn_ftth']
             
-            adresse_within = adresse_gdf[adresse_gdf.within(geometry)]
-            aggregate_pcn_ftth = adresse_within['pcn_ftth'].sum()
-            
             if za_pcn_ftth != aggregate_pcn_ftth:
                 invalid_pcn_ftth.append(row['pcn_code'])
                 print(f"{table_name} {row['pcn_code']} a pcn_ftth {za_pcn_ftth} qui ne correspond pas au nombre d'EL: {aggregate_pcn_ftth}.")
@@ -796,10 +720,10 @@ async def verify_pcn_ftth(zpa_gdf, pb_gdf, zpbo_gdf, zsro_gdf, adresse_gdf):
         return invalid_pcn_ftth
 
     # Vérification pour chaque table
-    invalid_zpa = check_table(zpa_gdf, 'ZPA')
-    invalid_pb = check_table(pb_gdf, 'PB')
-    invalid_zpbo = check_table(zpbo_gdf, 'ZPBO')
-    invalid_zsro = check_table(zsro_gdf, 'ZSRO')
+    invalid_zpa = await check_table(zpa_gdf, 'ZPA')
+    invalid_pb = await check_table(pb_gdf, 'PB')
+    invalid_zpbo = await check_table(zpbo_gdf, 'ZPBO')
+    invalid_zsro = await check_table(zsro_gdf, 'ZSRO')
 
     return {
         'invalid_zpa': invalid_zpa,
@@ -808,7 +732,7 @@ async def verify_pcn_ftth(zpa_gdf, pb_gdf, zpbo_gdf, zsro_gdf, adresse_gdf):
         'invalid_zsro': invalid_zsro
     }
 
-async def verify_pcn_ftte_zsro(zsro_gdf, adresse_gdf):
+async def verify_pcn_ftte_zsro(zsro_gdf, adresse_gdf, ctx=None):
     missing_pcn_ftte = zsro_gdf['pcn_ftte'].isna() | (zsro_gdf['pcn_ftte'] == '')
     
     if missing_pcn_ftte.any():
@@ -816,20 +740,18 @@ async def verify_pcn_ftte_zsro(zsro_gdf, adresse_gdf):
         return False
     
     invalid_pcn_ftte = []
-    for i, row in zsro_gdf.iterrows():
-        zs_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zsro_gdf, adresse_gdf, 'pcn_ftte')
+    for row, aggregate_pcn_ftte in zip(zsro_gdf.to_dict('records'), aggregate_sums):
         zs_pcn_ftte = row['pcn_ftte']
         
-        adresse_within_zsro = adresse_gdf[adresse_gdf.within(zs_geometry)]
-        aggregate_pcn_ftte = adresse_within_zsro['pcn_ftte'].sum()
-        
         if zs_pcn_ftte != aggregate_pcn_ftte:
             invalid_pcn_ftte.append(row['zs_code'])
             print(f"ZSRO {row['zs_code']} a pcn_ftth {zs_pcn_ftte} qui ne correspond pas à la valeur correcte: {aggregate_pcn_ftte}.")
     
     return invalid_pcn_ftte
 
-async def verify_pcn_umtot_zsro(zsro_gdf, pb_gdf):
+async def verify_pcn_umtot_zsro(zsro_gdf, pb_gdf, ctx=None):
     missing_pcn_umtot = zsro_gdf['pcn_umtot'].isna() | (zsro_gdf['pcn_umtot'] == '')
     
     if missing_pcn_umtot.any():
@@ -837,13 +759,11 @@ async def verify_pcn_umtot_zsro(zsro_gdf, pb_gdf):
         return False
     
     invalid_pcn_umtot = []
-    for i, row in zsro_gdf.iterrows():
-        zs_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zsro_gdf, pb_gdf, 'pcn_umftth')
+    for row, correct_pcn_umtot in zip(zsro_gdf.to_dict('records'), aggregate_sums):
         zs_pcn_umtot = row['pcn_umtot']
         
-        pb_within_zsro = pb_gdf[pb_gdf.within(zs_geometry)]
-        correct_pcn_umtot = pb_within_zsro['pcn_umftth'].sum()
-        
         if zs_pcn_umtot != correct_pcn_umtot:
             invalid_pcn_umtot.append(row['zs_code'])
             print(f"ZSRO {row['zs_code']} a pcn_ftth {zs_pcn_umtot} qui ne correspond pas à la valeur correcte: {correct_pcn_umtot}.")
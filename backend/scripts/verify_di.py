@@ -1,49 +1,39 @@
 import geopandas as gpd
-from shapely.geometry import  LineString, MultiPolygon, Polygon
+from shapely.geometry import MultiPolygon, Polygon
 from shapely import wkt
+import numpy as np
 import pandas as pd
-import re, os
+import re
+import shapely
 from ..metrics import *
+from .anomaly_exports import export_layer
+from .context import DatasetContext
+from .spatial import max_per_zone, points_hit_layers
 
 def reset_metrics():
     print("Resetting all metrics...") 
-    ANOMALY_COUNT.set(0)
-    MISSING_PCN_CODE_PA.set(0)
-    MISSING_PCN_CB_ENT_PA.set(0)
-    DUPLICATE_COUNT.clear()
-    NOT_IN_ZONE.clear()
-    LONG_CONN_PERCENT.set(0)
-    LONG_CONN_CM_LENGTH.clear()
-    CB_CAPAFO_EXCESS.clear()
-    PA_UMFTTH_EXCESS.clear()
-    SRO_UMTOT_EXCESS.clear()
-    CB_D1_LENGTH_EXCESS.clear()
-    PA_ON_ENEDIS_SUPPORT.clear()
-    ZPBO_NOT_IN_ZPA.clear()
-    SUPPORT_DISTANCE_EXCEEDING_MAX.clear()
-    ZPA_NOT_IN_ZSRO.clear()
-    ZSRO_NOT_IN_ZNRO.clear()
-    PBR_EL_EXCESS.clear()
-    PB_SINGLE_EL.clear()
-    INVALID_PCN_CODE_PA.clear()
-    INVALID_PCN_CB_ENT_PA.clear()
+    clear_gauges()
     print("done")
 
-def convert_geometries_to_wkt(gdf):
-    gdf['wkt'] = gdf['geometry'].apply(lambda geom: wkt.dumps(geom))
-    return gdf
+def is_aerial_support(support_gdf):
+    return support_gdf['pcn_newsup'].str.contains("POTEAU|IMMEUBLE", case=False, na=False)
 
-async def verify_cb_capafo(cb_gdf, support_gdf):
-    filtered_supports = support_gdf[support_gdf['pcn_newsup'].str.contains("POTEAU|IMMEUBLE", case=False, na=False)]
+def is_poteau(support_gdf):
+    return support_gdf['pcn_newsup'].str.startswith('POTEAU', na=False)
+
+def is_enedis_support(support_gdf):
+    return support_gdf['pt_prop'].str.upper() == 'ENEDIS'
+
+async def verify_cb_capafo(cb_gdf, support_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    filtered_supports = ctx.subset(support_gdf, 'aerial', is_aerial_support)
     
-    invalid_cb_capafo = []
+    aerial = points_hit_layers(cb_gdf.geometry.values, [(filtered_supports, 'intersects')])
+    excess_cb = cb_gdf[aerial & (cb_gdf['cb_capafo'] > 144).to_numpy()]
 
-    for i, cb_row in cb_gdf.iterrows():
-        has_support = any(cb_row.geometry.intersects(support.geometry) for support in filtered_supports.itertuples())
-        
-        if has_support and cb_row['cb_capafo'] > 144:
-            invalid_cb_capafo.append(cb_row['cl_codeext'])
-            CB_CAPAFO_EXCESS.labels(cl_codeext=cb_row['cl_codeext']).set(cb_row['cb_capafo'])
+    invalid_cb_capafo = excess_cb['cl_codeext'].tolist()
+    for code, capafo in zip(invalid_cb_capafo, excess_cb['cb_capafo'].tolist()):
+        CB_CAPAFO_EXCESS.labels(cl_codeext=code).set(capafo)
 
     if invalid_cb_capafo:
         ANOMALY_COUNT.inc(len(invalid_cb_capafo))
@@ -116,12 +106,13 @@ async def verify_length_D1(cb_di_gdf):
 
     return invalid_cbs
 
-async def verify_no_overlap(pa_gdf: gpd.GeoDataFrame, support_gdf: gpd.GeoDataFrame):
+async def verify_no_overlap(pa_gdf: gpd.GeoDataFrame, support_gdf: gpd.GeoDataFrame, ctx=None):
+    ctx = ctx or DatasetContext()
     invalid = []
     rows_to_export = []
 
     try:
-        enedis = support_gdf[support_gdf['pt_prop'].str.upper() == 'ENEDIS']
+        enedis = ctx.subset(support_gdf, 'enedis', is_enedis_support)
         overlaps = gpd.overlay(pa_gdf, enedis, how='intersection')
 
         for _, row in overlaps.iterrows():
@@ -136,35 +127,23 @@ async def verify_no_overlap(pa_gdf: gpd.GeoDataFrame, support_gdf: gpd.GeoDataFr
 
             # Exportation de la couche des anomalies
             export_gdf = gpd.GeoDataFrame(rows_to_export, crs=pa_gdf.crs)
-
-            downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-            os.makedirs(downloads, exist_ok=True)
-
-            shp_path = os.path.join(downloads, "pa_on_enedis_support.shp")
-            gpkg_path = os.path.join(downloads, "pa_on_enedis_support.gpkg")
-
-            export_gdf.to_file(shp_path, driver='ESRI Shapefile', encoding='UTF-8')
-            print(f"Shapefile exporté dans : {shp_path}")
-
-            export_gdf.to_file(gpkg_path, layer="pa_on_enedis_support", driver='GPKG')
-            print(f"GeoPackage exporté dans : {gpkg_path}")
+            export_layer("pa_on_enedis_support", export_gdf)
 
     except Exception as e:
         print(f"Erreur lors de la vérification de la superposition : {e}")
 
     return invalid
 
-async def verify_zpb_in_zonepa(zpbo_gdf, zpa_gdf):
-    if zpbo_gdf.crs != zpa_gdf.crs:
-        zpbo_gdf = zpbo_gdf.to_crs(zpa_gdf.crs)
-    zpa_gdf = convert_geometries_to_wkt(zpa_gdf)
-    zpa_dict = {row['pcn_code']: wkt.loads(row['wkt']) for _, row in zpa_gdf.iterrows()}
+async def verify_zpb_in_zonepa(zpbo_gdf, zpa_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    zpbo_gdf = ctx.to_crs(zpbo_gdf, zpa_gdf.crs)
+    zpa_geoms = ctx.zones_by_code(zpa_gdf, 'pcn_code').geometry
 
     records = []
     for _, row in zpbo_gdf.iterrows():
-        geom = row['geometry'] if 'geometry' in row else wkt.loads(row['wkt'])
+        geom = row['geometry']
         code = row['pcn_code']
-        zpa_geom = zpa_dict.get(row['pcn_zpa'])
+        zpa_geom = zpa_geoms.get(row['pcn_zpa'])
         if zpa_geom is None:
             continue
         diff = geom.difference(zpa_geom)
@@ -184,55 +163,57 @@ async def verify_zpb_in_zonepa(zpbo_gdf, zpa_gdf):
     export_gdf = gpd.GeoDataFrame([
         {'pcn_code': r['pcn_code'], 'geometry': wkt.loads(r['wkt'])} for r in records
     ], crs=zpbo_gdf.crs)
-    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    os.makedirs(downloads, exist_ok=True)
-    export_gdf.to_file(os.path.join(downloads, "zpb_not_in_zpa.shp"), driver='ESRI Shapefile', encoding='UTF-8', engine='fiona')
-    export_gdf.to_file(os.path.join(downloads, "zpb_not_in_zpa.gpkg"), layer="zpb_not_in_zpa", driver='GPKG')
+    export_layer("zpb_not_in_zpa", export_gdf)
     ANOMALY_COUNT.inc(len(records))
     return records
 
-async def verify_max_distance_between_supports(cm_gdf, support_gdf, max_distance=40):
-    if cm_gdf.crs != support_gdf.crs:
-        support_gdf = support_gdf.to_crs(cm_gdf.crs)
-
-    filtered_support_gdf = support_gdf[support_gdf['pcn_newsup'].str.startswith('POTEAU')]
-
-    support_distances_exceeding_max = []
-
-    for cm_idx, cm_row in cm_gdf.iterrows():
-        cm_line = cm_row.geometry
-        support_points = []
-
-        for support_idx, support_row in filtered_support_gdf.iterrows():
-            support_point = support_row.geometry
-            if cm_line.intersects(support_point):
-                support_points.append((support_point, support_row['pt_codeext']))
-
-        support_points.sort(key=lambda point: cm_line.project(point[0]))
-
-        for i in range(len(support_points) - 1):
-            start_point, start_support_code = support_points[i]
-            end_point, end_support_code = support_points[i + 1]
-            distance = start_point.distance(end_point)
-
-            segment = LineString([start_point, end_point])
-            other_supports_between = support_gdf[~support_gdf['pcn_newsup'].str.startswith('POTEAU') & 
-                                                 support_gdf.intersects(segment)]
-
-            if other_supports_between.empty:
-                if distance > max_distance:
-                    support_distances_exceeding_max.append((start_support_code, end_support_code, distance))
-                    SUPPORT_DISTANCE_EXCEEDING_MAX.labels(start_support_code=start_support_code, end_support_code=end_support_code).set(distance)
-                    print(f"La distance entre les supports {start_support_code} et {end_support_code} dépasse {max_distance} mètres : {distance:.2f} mètres")
+async def verify_max_distance_between_supports(cm_gdf, support_gdf, max_distance=40, ctx=None):
+    ctx = ctx or DatasetContext()
+    support_gdf = ctx.to_crs(support_gdf, cm_gdf.crs)
+
+    filtered_support_gdf = ctx.subset(support_gdf, 'poteau', is_poteau)
+    other_support_gdf = ctx.subset(support_gdf, 'not_poteau', lambda gdf: ~is_poteau(gdf))
+
+    # Poteaux posés sur chaque CM, ordonnés par CM puis par abscisse curviligne le long du CM
+    cm_lines = np.asarray(cm_gdf.geometry.values, dtype=object)
+    support_points = np.asarray(filtered_support_gdf.geometry.values, dtype=object)
+    cm_idx, support_idx = filtered_support_gdf.sindex.query(cm_lines, predicate='intersects')
+    position = shapely.line_locate_point(cm_lines[cm_idx], support_points[support_idx])
+    order = np.lexsort((support_idx, position, cm_idx))
+    cm_idx, support_idx = cm_idx[order], support_idx[order]
+
+    # Poteaux consécutifs sur un même CM
+    same_cm = cm_idx[:-1] == cm_idx[1:]
+    start_idx, end_idx = support_idx[:-1][same_cm], support_idx[1:][same_cm]
+    gaps = shapely.distance(support_points[start_idx], support_points[end_idx])
+    too_far = gaps > max_distance
+    start_idx, end_idx, gaps = start_idx[too_far], end_idx[too_far], gaps[too_far]
+
+    # Un autre support sur le segment entre les deux poteaux lève l'anomalie
+    segments = shapely.linestrings(np.stack([
+        shapely.get_coordinates(support_points[start_idx]),
+        shapely.get_coordinates(support_points[end_idx]),
+    ], axis=1)) if len(start_idx) else np.array([], dtype=object)
+    supported = points_hit_layers(segments, [(other_support_gdf, 'intersects')])
+
+    support_codes = filtered_support_gdf['pt_codeext'].to_numpy()
+    support_distances_exceeding_max = list(zip(
+        support_codes[start_idx[~supported]].tolist(),
+        support_codes[end_idx[~supported]].tolist(),
+        gaps[~supported].tolist(),
+    ))
+    for start_support_code, end_support_code, distance in support_distances_exceeding_max:
+        SUPPORT_DISTANCE_EXCEEDING_MAX.labels(start_support_code=start_support_code, end_support_code=end_support_code).set(distance)
+        print(f"La distance entre les supports {start_support_code} et {end_support_code} dépasse {max_distance} mètres : {distance:.2f} mètres")
 
     if support_distances_exceeding_max:
         ANOMALY_COUNT.inc(len(support_distances_exceeding_max))
 
     return support_distances_exceeding_max
 
-async def verify_zpa_in_zonesro(zpa_gdf, zsro_gdf):
-    if zpa_gdf.crs != zsro_gdf.crs:
-        zpa_gdf = zpa_gdf.to_crs(zsro_gdf.crs)
+async def verify_zpa_in_zonesro(zpa_gdf, zsro_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
+    zpa_gdf = ctx.to_crs(zpa_gdf, zsro_gdf.crs)
 
     zsro_geom = zsro_gdf.iloc[0]['geometry']
     records = []
@@ -266,12 +247,7 @@ async def verify_zpa_in_zonesro(zpa_gdf, zsro_gdf):
         {'pcn_code': r['pcn_code'], 'geometry': wkt.loads(r['wkt'])} for r in records
     ], crs=zpa_gdf.crs)
 
-    # Sauvegarder les fichiers dans le dossier Téléchargements
-    downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    os.makedirs(downloads, exist_ok=True)
-
-    export_gdf.to_file(os.path.join(downloads, "zpa_not_in_zsro.shp"), driver='ESRI Shapefile', encoding='UTF-8', engine='fiona')
-    export_gdf.to_file(os.path.join(downloads, "zpa_not_in_zsro.gpkg"), layer="zpa_not_in_zsro", driver='GPKG')
+    export_layer("zpa_not_in_zsro", export_gdf)
 
     ANOMALY_COUNT.inc(len(records))
     return records
@@ -337,7 +313,8 @@ async def verify_pcn_code_pa(pa_gdf, zpa_gdf):
         "invalid_pcn_codes": invalid_pcn_codes
     }
 
-async def verify_pcn_cb_ent_pa(pa_gdf, cb_di_gdf):
+async def verify_pcn_cb_ent_pa(pa_gdf, cb_di_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
     missing_pcn_cb_ent = pa_gdf['pcn_cb_ent'].isna() | (pa_gdf['pcn_cb_ent'] == '')
     num_missing_pcn_cb_ent = missing_pcn_cb_ent.sum()
     
@@ -347,34 +324,19 @@ async def verify_pcn_cb_ent_pa(pa_gdf, cb_di_gdf):
         ANOMALY_COUNT.inc(num_missing_pcn_cb_ent)
     
     invalid_pcn_cb_ent = []
+    max_cb_capafo = max_per_zone(pa_gdf, cb_di_gdf, 'cb_capafo', ctx.line_endpoints(cb_di_gdf))
 
-    for i, row in pa_gdf.iterrows():
-        pa_geometry = row['geometry']
-        pa_pcn_cb_ent_ex = row['pcn_cb_ent']
-        
-        def intersects_with_pa(x):
-            boundary = x.geometry.boundary
-            if boundary.geom_type == 'MultiPoint':
-                return any(pa_geometry.contains(point) for point in boundary.geoms)
-            elif boundary.geom_type == 'Point':
-                return pa_geometry.contains(boundary)
-            else:
-                return False
-        
-        cb_intersections = cb_di_gdf[cb_di_gdf.apply(intersects_with_pa, axis=1)]
-        
-        if cb_intersections.empty:
-            print(f"No intersections found for PA {row['pcn_code']}.")
+    for i, (pa_pcn_code, pa_pcn_cb_ent_ex) in enumerate(zip(pa_gdf['pcn_code'], pa_gdf['pcn_cb_ent'])):
+        max_capafo = max_cb_capafo.get(i)
+        if max_capafo is None:
+            print(f"No intersections found for PA {pa_pcn_code}.")
             continue
-        
-        cb_capafo_values = cb_intersections['cb_capafo'].values
-        max_cb_capafo = max(cb_capafo_values)
-        
-        if pa_pcn_cb_ent_ex != max_cb_capafo:
-            invalid_pcn_cb_ent.append(row['pcn_code'])
-            INVALID_PCN_CB_ENT_PA.labels(pcn_code=row['pcn_code'], pcn_cb_ent_pa=pa_pcn_cb_ent_ex, expected_pcn_cb_ent_pa=max_cb_capafo).set(1)
+
+        if pa_pcn_cb_ent_ex != max_capafo:
+            invalid_pcn_cb_ent.append(pa_pcn_code)
+            INVALID_PCN_CB_ENT_PA.labels(pcn_code=pa_pcn_code, pcn_cb_ent_pa=pa_pcn_cb_ent_ex, expected_pcn_cb_ent_pa=max_capafo).set(1)
             ANOMALY_COUNT.inc()
-            print(f"PA {row['pcn_code']} has pcn_cb_ent : {pa_pcn_cb_ent_ex} which does not match the maximum cb_capafo value: {max_cb_capafo}.")
+            print(f"PA {pa_pcn_code} has pcn_cb_ent : {pa_pcn_cb_ent_ex} which does not match the maximum cb_capafo value: {max_capafo}.")
     
     return invalid_pcn_cb_ent
 
@@ -411,43 +373,29 @@ def verify_pcn_code_zpa(zpa_gdf):
     
     return invalid_pcn_code
 
-def verify_pcn_capa_zpa(zpa_gdf, cb_di_gdf):
+def verify_pcn_capa_zpa(zpa_gdf, cb_di_gdf, ctx=None):
+    ctx = ctx or DatasetContext()
     missing_pcn_capa = zpa_gdf['pcn_capa'].isna() | (zpa_gdf['pcn_capa'] == '')
     
     if missing_pcn_capa.any():
         print("La colonne pcn_capa contient une/des valeurs manquantes dans la table attributaire de ZPA")
         return False
     invalid_pcn_capa = []
+    max_cb_capafo = max_per_zone(zpa_gdf, cb_di_gdf, 'cb_capafo', ctx.line_endpoints(cb_di_gdf))
 
-    for i, row in zpa_gdf.iterrows():
-        zpa_geometry = row['geometry']
-        zpa_pcn_capa = row['pcn_capa']
-        def intersects_with_zpa(x):
-            boundary = x.geometry.boundary
-            if boundary.geom_type == 'MultiPoint':
-                return any(zpa_geometry.contains(point) for point in boundary.geoms)
-            elif boundary.geom_type == 'Point':
-                return zpa_geometry.contains(boundary)
-            else:
-                return False
-        
-        cb_intersections = cb_di_gdf[cb_di_gdf.apply(intersects_with_zpa, axis=1)]
-        
-        if cb_intersections.empty:
-            print(f"No intersections found for ZPA {row['pcn_code']}.")
+    for i, (zpa_pcn_code, zpa_pcn_capa) in enumerate(zip(zpa_gdf['pcn_code'], zpa_gdf['pcn_capa'])):
+        max_capafo = max_cb_capafo.get(i)
+        if max_capafo is None:
+            print(f"No intersections found for ZPA {zpa_pcn_code}.")
             continue
-        
-        cb_capafo_values = cb_intersections['cb_capafo'].values
-        
-        max_cb_capafo = max(cb_capafo_values)
-        
-        if zpa_pcn_capa != max_cb_capafo:
-            invalid_pcn_capa.append(row['pcn_code'])
-            print(f"ZPA {row['pcn_code']} has pcn_capa {zpa_pcn_capa} which does not match the maximum cb_capafo value {max_cb_capafo}.")
+
+        if zpa_pcn_capa != max_capafo:
+            invalid_pcn_capa.append(zpa_pcn_code)
+            print(f"ZPA {zpa_pcn_code} has pcn_capa {zpa_pcn_capa} which does not match the maximum cb_capafo value {max_capafo}.")
     
     return invalid_pcn_capa
 
-def verify_pcn_ftth_zpa(zpa_gdf, adresse_gdf):
+def verify_pcn_ftth_zpa(zpa_gdf, adresse_gdf, ctx=None):
     missing_pcn_ftth = zpa_gdf['pcn_ftth'].isna() | (zpa_gdf['pcn_ftth'] == '')
     
     if missing_pcn_ftth.any():
@@ -455,20 +403,18 @@ def verify_pcn_ftth_zpa(zpa_gdf, adresse_gdf):
         return False
     
     invalid_pcn_ftth = []
-    for i, row in zpa_gdf.iterrows():
-        za_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zpa_gdf, adresse_gdf, 'pcn_ftth')
+    for row, aggregate_pcn_ftth in zip(zpa_gdf.to_dict('records'), aggregate_sums):
         za_pcn_ftth = row['pcn_ftth']
         
-        adresse_within_zpa = adresse_gdf[adresse_gdf.within(za_geometry)]
-        aggregate_pcn_ftth = adresse_within_zpa['pcn_ftth'].sum()
-        
         if za_pcn_ftth != aggregate_pcn_ftth:
             invalid_pcn_ftth.append(row['pcn_code'])
             print(f"ZPA {row['pcn_code']} a pcn_ftth {za_pcn_ftth} qui ne correspond pas au nombre d'EL: {aggregate_pcn_ftth}.")
     
     return invalid_pcn_ftth
 
-def verify_pcn_umftth_zpa(zpa_gdf, pb_gdf):
+def verify_pcn_umftth_zpa(zpa_gdf, pb_gdf, ctx=None):
     missing_pcn_umftth = zpa_gdf['pcn_umftth'].isna() | (zpa_gdf['pcn_umftth'] == '')
     
     if missing_pcn_umftth.any():
@@ -476,20 +422,18 @@ def verify_pcn_umftth_zpa(zpa_gdf, pb_gdf):
         return False
     
     invalid_pcn_umftth = []
-    for i, row in zpa_gdf.iterrows():
-        za_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zpa_gdf, pb_gdf, 'pcn_umftth')
+    for row, aggregate_pcn_umftth in zip(zpa_gdf.to_dict('records'), aggregate_sums):
         za_pcn_umftth = row['pcn_umftth']
         
-        pb_within_zpa = pb_gdf[pb_gdf.within(za_geometry)]
-        aggregate_pcn_umftth = pb_within_zpa['pcn_umftth'].sum()
-        
         if za_pcn_umftth != aggregate_pcn_umftth:
             invalid_pcn_umftth.append(row['pcn_code'])
             print(f"ZPA {row['pcn_code']} a pcn_umftth {za_pcn_umftth} qui ne correspond pas au nombre d'EL: {aggregate_pcn_umftth}.")
     
     return invalid_pcn_umftth
 
-def verify_pcn_ftte_zpa(zpa_gdf, adresse_gdf):
+def verify_pcn_ftte_zpa(zpa_gdf, adresse_gdf, ctx=None):
     missing_pcn_ftte = zpa_gdf['pcn_ftte'].isna() | (zpa_gdf['pcn_ftte'] == '')
     
     if missing_pcn_ftte.any():
@@ -497,20 +441,18 @@ def verify_pcn_ftte_zpa(zpa_gdf, adresse_gdf):
         return False
     
     invalid_pcn_ftte = []
-    for i, row in zpa_gdf.iterrows():
-        za_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zpa_gdf, adresse_gdf, 'pcn_ftte')
+    for row, aggregate_pcn_ftte in zip(zpa_gdf.to_dict('records'), aggregate_sums):
         za_pcn_ftte = row['pcn_ftte']
         
-        adresse_within_zpa = adresse_gdf[adresse_gdf.within(za_geometry)]
-        aggregate_pcn_ftte = adresse_within_zpa['pcn_ftte'].sum()
-        
         if za_pcn_ftte != aggregate_pcn_ftte:
             invalid_pcn_ftte.append(row['pcn_code'])
             print(f"ZPA {row['pcn_code']} a pcn_ftth {za_pcn_ftte} qui ne correspond pas au nombre d'EL: {aggregate_pcn_ftte}.")
     
     return invalid_pcn_ftte
 
-def verify_pcn_umftte_zpa(zpa_gdf, pb_gdf):
+def verify_pcn_umftte_zpa(zpa_gdf, pb_gdf, ctx=None):
     if 'pcn_umftte' not in pb_gdf.columns:
         print("La colonne 'pcn_umftte' n'existe pas dans pb_gdf.")
         return False
@@ -520,13 +462,11 @@ def verify_pcn_umftte_zpa(zpa_gdf, pb_gdf):
         print("La colonne pcn_umftte contient une/des valeurs manquantes dans la table attributaire de ZPA")
         return False
     invalid_pcn_umftte = []
-    for i, row in zpa_gdf.iterrows():
-        za_geometry = row['geometry']
+    aggregates = (ctx or DatasetContext()).aggregates
+    aggregate_sums = aggregates.sums(zpa_gdf, pb_gdf, 'pcn_umftte')
+    for row, aggregate_pcn_umftte in zip(zpa_gdf.to_dict('records'), aggregate_sums):
         za_pcn_umftte = row['pcn_umftte']
         
-        pb_within_zpa = pb_gdf[pb_gdf.within(za_geometry)]
-        aggregate_pcn_umftte = pb_within_zpa['pcn_umftte'].sum()
-        
         if za_pcn_umftte != aggregate_pcn_umftte:
             invalid_pcn_umftte.append(row['pcn_code'])
             print(f"ZPA {row['pcn_code']} a pcn_umftte {za_pcn_umftte} qui ne correspond pas au nombre d'EL: {aggregate_pcn_umftte}.")
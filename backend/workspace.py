@@ -0,0 +1,41 @@
+import os
+import shutil
+import time
+import uuid
+from backend.config import JOBS_DIR
+from backend.jobs import job_queue
+
+# Détail par entité des jauges d'un traitement, écrit dans son répertoire
+ANOMALY_DETAIL_FILE = 'anomalies.json'
+# Profil d'un traitement demandé avec profile (voir scripts/profiling.py)
+PROFILE_DIR = 'profile'
+
+
+def create_workspace():
+    # Répertoire propre à un traitement : archive reçue, fichier d'information et couches extraites
+    job_id = uuid.uuid4().hex
+    path = workspace_path(job_id)
+    os.makedirs(path)
+    return job_id, path
+
+
+def workspace_path(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def delete_old_workspaces(max_age, root=JOBS_DIR):
+    now = time.time()
+    if not os.path.isdir(root):
+        return
+    for job_id in os.listdir(root):
+        path = os.path.join(root, job_id)
+        # Traitement en attente ou en cours : son répertoire est conservé quel que soit son âge
+        job = job_queue.get(job_id)
+        if job is not None and job['status'] in ('queued', 'running'):
+            continue
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path)
+                print(f"Deleted {path}")
+        except Exception as e:
+            print(f"Error deleting job directory {path}: {e}")
@@ -13,6 +13,7 @@ export class FileUploadComponent {
   file: File | null = null;
   uploadMessage: string = '';
   isLoading: boolean = false;
+  pollTimer: ReturnType<typeof setTimeout> | null = null;
 
   constructor(private router: Router) {
     this.choice = localStorage.getItem('projectChoice');
@@ -69,12 +70,10 @@ export class FileUploadComponent {
           }
           return response.json();
         })
-        .then((data) => {
-          console.log(data);
-          this.uploadMessage = 'File uploaded and analyzed successfully!';
-          this.isLoading = false;
-          window.location.href =
-            'http://localhost:3000/d/bc71b594-d3c7-42d6-acfb-ea226470477f/new-dashboard?orgId=1&from=now-6h&to=now&timezone=browser&showCategory=Repeat%20options';
+        .then((job) => {
+          console.log(job);
+          this.uploadMessage = 'File uploaded, analysis in progress...';
+          this.pollJob(job.job_id);
         })
         .catch((error) => {
           console.error('Error:', error);
@@ -86,7 +85,44 @@ export class FileUploadComponent {
     }
   }
 
+  pollJob(jobId: string) {
+    fetch(`http://localhost:5000/jobs/${jobId}`)
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+      })
+      .then((job) => {
+        if (!this.isLoading) {
+          return;
+        }
+        if (job.status === 'done') {
+          console.log(job.result);
+          this.uploadMessage = 'File uploaded and analyzed successfully!';
+          this.isLoading = false;
+          window.location.href =
+            'http://localhost:3000/d/bc71b594-d3c7-42d6-acfb-ea226470477f/new-dashboard?orgId=1&from=now-6h&to=now&timezone=browser&showCategory=Repeat%20options' +
+            '&var-job_id=' + encodeURIComponent(jobId);
+        } else if (job.status === 'failed') {
+          this.uploadMessage = 'Error analyzing file. ' + job.error;
+          this.isLoading = false;
+        } else {
+          this.pollTimer = setTimeout(() => this.pollJob(jobId), 2000);
+        }
+      })
+      .catch((error) => {
+        console.error('Error:', error);
+        this.uploadMessage = 'Error checking analysis status. ' + error.message;
+        this.isLoading = false;
+      });
+  }
+
   cancel() {
+    if (this.pollTimer) {
+      clearTimeout(this.pollTimer);
+      this.pollTimer = null;
+    }
     this.file = null;
     this.uploadMessage = '';
     this.isLoading = false;